@@ -0,0 +1,70 @@
+"""
+parsing of a large masscan xml file (user-012)
+
+masscan writes one <host> line per open port, the parser combines them into one record per host,
+a synthetic file of --lines lines is generated (about five ports per host, with repeated ports) and
+parsed at a quarter, half and the full size, the time per line must stay flat as the file grows
+
+    PYTHONPATH=. python benchmarks/masscan_parser.py [--lines 1000000] [--keep DIR]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from gummy.tools.parser import Parser
+
+PORTS = [22, 53, 80, 161, 443, 445, 3389, 8080]
+UDP_PORTS = [53, 161]
+
+
+def write_masscan_xml(path, lines, seed=1):
+    """synthetic masscan xml output with the number of <host> lines"""
+    rnd = random.Random(seed)
+    hosts = max(1, lines // 5)
+    with open(path, 'w') as xml_file:
+        xml_file.write('<?xml version="1.0"?>\n'
+                       '<nmaprun scanner="masscan" start="1600000000" version="1.0-BETA"  xmloutputversion="1.03">\n'
+                       '<scaninfo type="syn" protocol="tcp" />\n')
+        for _ in range(lines):
+            host = rnd.randrange(hosts)
+            port = rnd.choice(PORTS)
+            protocol = 'udp' if port in UDP_PORTS else 'tcp'
+            xml_file.write(f'<host endtime="1600000001"><address addr="10.{host >> 16 & 255}.{host >> 8 & 255}.'
+                           f'{host & 255}" addrtype="ipv4"/><ports><port protocol="{protocol}" portid="{port}">'
+                           f'<state state="open" reason="syn-ack" reason_ttl="64"/></port></ports></host>\n')
+        xml_file.write('<runstats><finished time="1600000100" timestr="x" elapsed="100" />'
+                       '<hosts up="1" down="0" total="1" /></runstats>\n</nmaprun>\n')
+
+
+def parse(path):
+    """parse the file without the sidecar cache, return the parser and the time (seconds)"""
+    parser = Parser()
+    parser.use_cache = False
+    start = time.perf_counter()
+    parser(path)
+    return parser, time.perf_counter() - start
+
+
+def main():
+    """run the benchmark with the command line parameters"""
+    args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    args.add_argument('--lines', type=int, default=1000000, help='number of <host> lines of the largest file')
+    args.add_argument('--keep', help='directory for the generated files (they are reused), a temporary one by default')
+    args = args.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = args.keep or temp_dir
+        for lines in (args.lines // 4, args.lines // 2, args.lines):
+            path = os.path.join(directory, f'bench-m-masscan-{lines}.xml')
+            if not os.path.exists(path):
+                write_masscan_xml(path, lines)
+            parser, seconds = parse(path)
+            sockets = sum(len(host['ports']) for host in parser.result)
+            print(f'{lines:>8} lines: {len(parser.result):>7} hosts {sockets:>8} sockets '
+                  f'{seconds:6.2f} s {seconds / lines * 1e6:5.2f} us per line')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+processing of the masscan console output at high discovery rates (user-018)
+
+the recorded output (a file with the stdout and stderr of masscan, or a generated one: --discoveries
+"Discovered open port" lines, repeated discoveries and a status line with \\r every 50 lines) is replayed
+through Mscanner._read_stream in pipe-sized writes, so the lines are split between the reads,
+the number of sockets in the storage must be the number of unique discoveries of the output
+
+    PYTHONPATH=. python benchmarks/masscan_stream.py [--discoveries 500000] [--record FILE] [--save FILE]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import re
+import time
+
+from gummy.modules.m_scanner import Mscanner
+from gummy.tools.storage import Storage
+
+PIPE_SIZE = 4096
+DISCOVERED = re.compile(rb'Discovered open port (\d+)/(\w+) on ([\d.]+)')
+
+
+class ReplayMscanner(Mscanner):
+    """masscan module without the program, only the output processing is used"""
+
+    def _check_prog(self):
+        """the program is not run"""
+        self.version = 'replay'
+
+
+def masscan_output(discoveries, seed=3):
+    """console output of masscan with the number of discoveries"""
+    rnd = random.Random(seed)
+    lines = list()
+    for i in range(discoveries):
+        protocol = 'udp' if i % 7 == 0 else 'tcp'
+        line = (f'Discovered open port {rnd.choice([22, 80, 161, 443, 445])}/{protocol} '
+                f'on 10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}                                  \n')
+        lines.append(line)
+        if i % 3 == 0:
+            # masscan reports the port again when the answer to a retransmission comes
+            lines.append(line)
+        if i % 50 == 0:
+            lines.append(f'rate: 99.98-kpps, {100 * i / discoveries:5.2f}% done,   0:0{i % 10}:00 remaining, '
+                         f'found={i}       \r')
+    return ''.join(lines).encode()
+
+
+async def replay(data, stream):
+    """writing the output to the stream like a pipe does, the reader runs between the writes"""
+    for offset in range(0, len(data), PIPE_SIZE):
+        stream.feed_data(data[offset:offset + PIPE_SIZE])
+        await asyncio.sleep(0)
+    stream.feed_eof()
+
+
+async def read_output(scanner, data):
+    """replay the output through the scanner, return the time (seconds)"""
+    stream = asyncio.StreamReader()
+    scanner.buffer = scanner.db.buffer(size=scanner.flush_size, interval=scanner.flush_interval)
+    start = time.perf_counter()
+    await asyncio.gather(replay(data, stream), scanner._read_stream(stream))
+    scanner.buffer.flush()
+    return time.perf_counter() - start
+
+
+def main():
+    """run the benchmark with the command line parameters"""
+    args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    args.add_argument('--discoveries', type=int, default=500000, help='number of discoveries of the generated output')
+    args.add_argument('--record', help='recorded masscan output to replay instead of the generated one')
+    args.add_argument('--save', help='write the generated output to the file')
+    args = args.parse_args()
+
+    if args.record:
+        with open(args.record, 'rb') as record:
+            data = record.read()
+    else:
+        data = masscan_output(args.discoveries)
+        if args.save:
+            with open(args.save, 'wb') as record:
+                record.write(data)
+    unique = len(set(DISCOVERED.findall(data)))
+
+    scanner = ReplayMscanner(prog_path='masscan', scans_path='.', db=Storage())
+    loop = asyncio.new_event_loop()
+    # the progress messages are printed as in a real gummy_scan, to /dev/null
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        seconds = loop.run_until_complete(read_output(scanner, data))
+
+    print(f'{len(data)} bytes, {data.count(b"Discovered")} discoveries ({unique} unique): '
+          f'{seconds:.2f} s, {unique / seconds:.0f} discoveries per second')
+    print(f'sockets in the storage: {scanner.db.get_count_socket}' +
+          ('' if scanner.db.get_count_socket == unique else ' - DIFFERENT FROM THE OUTPUT'))
+
+
+if __name__ == '__main__':
+    main()
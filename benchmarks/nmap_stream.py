@@ -0,0 +1,97 @@
+"""
+processing of long nmap console output (user-022)
+
+a recorded transcript (a file with the stdout of nmap) or a generated one like a long
+-sV -O --stats-every 1s run (--lines lines: two status lines per second and a host report every 50 seconds)
+is replayed through Nscanner._read_stream in pipe-sized writes, the generated transcript is replayed at a
+quarter, half and the full size: the time per line and the peak memory must not grow with the transcript
+
+    PYTHONPATH=. python benchmarks/nmap_stream.py [--lines 2000000] [--record FILE] [--save FILE]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+import tracemalloc
+
+from gummy.modules.n_scanner import Nscanner
+from gummy.tools.storage import Storage
+
+PIPE_SIZE = 4096
+
+
+def nmap_output(lines):
+    """console output of a long nmap service scan with about the number of lines"""
+    out = ['Starting Nmap 7.80 ( https://nmap.org ) at 2020-01-01 00:00 UTC', '']
+    second = 0
+    while len(out) < lines:
+        second += 1
+        out.append(f'Stats: {second // 3600}:{second // 60 % 60:02d}:{second % 60:02d} elapsed; '
+                   f'0 hosts completed (1 up), 1 undergoing Service Scan')
+        out.append(f'Service scan Timing: About {second % 100}.00% done; ETC: 12:00 (0:00:{second % 60:02d} remaining)')
+        if second % 50 == 0:
+            out += [f'Nmap scan report for 10.0.{second >> 8 & 255}.{second & 255}',
+                    'Host is up.',
+                    '',
+                    'PORT   STATE SERVICE VERSION',
+                    '22/tcp open  ssh     OpenSSH 7.4']
+    return ('\n'.join(out) + '\n').encode()
+
+
+async def replay(data, stream):
+    """writing the output to the stream like a pipe does, the reader runs between the writes"""
+    for offset in range(0, len(data), PIPE_SIZE):
+        stream.feed_data(data[offset:offset + PIPE_SIZE])
+        await asyncio.sleep(0)
+    stream.feed_eof()
+
+
+async def read_output(scanner, data):
+    """replay the output through the scanner, return the time (seconds) and the peak memory (bytes)"""
+    stream = asyncio.StreamReader()
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(replay(data, stream), scanner._read_stream(stream))
+        seconds = time.perf_counter() - start
+        # the transcript itself is held by the benchmark, only the memory taken while reading is counted
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def run(data, loop):
+    """replay the transcript through a new nmap module, the log messages are printed to /dev/null"""
+    scanner = Nscanner(prog_path='nmap', db=Storage(), scans_path='.', version='replay')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        seconds, peak = loop.run_until_complete(read_output(scanner, data))
+    lines = data.count(b'\n')
+    print(f'{lines:>8} lines {len(data):>10} bytes: {seconds:6.2f} s {seconds / lines * 1e6:5.2f} us per line, '
+          f'peak {peak / 1024:.0f} KB')
+
+
+def main():
+    """run the benchmark with the command line parameters"""
+    args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    args.add_argument('--lines', type=int, default=2000000, help='number of lines of the largest generated transcript')
+    args.add_argument('--record', help='recorded nmap output to replay instead of the generated one')
+    args.add_argument('--save', help='write the largest generated transcript to the file')
+    args = args.parse_args()
+
+    loop = asyncio.new_event_loop()
+    if args.record:
+        with open(args.record, 'rb') as record:
+            run(record.read(), loop)
+        return
+    for lines in (args.lines // 4, args.lines // 2, args.lines):
+        data = nmap_output(lines)
+        run(data, loop)
+    if args.save:
+        with open(args.save, 'wb') as record:
+            record.write(data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+ingestion cost of the storage as it grows (user-002)
+
+the hosts are added the way the scanners add them: in batches of the buffer size (one record per
+batch is the old per-port path of Mscanner), the time per added record is printed for each quarter
+of the run, it must stay flat while the storage grows (--no-gc leaves out the cyclic garbage collector,
+its full collections take longer as the heap grows, whatever the storage does)
+
+    PYTHONPATH=. python benchmarks/storage_ingest.py [--records 200000] [--batch 500] [--storage storage] [--no-gc]
+"""
+import argparse
+import gc
+import tempfile
+import time
+
+from gummy.tools.compact_storage import CompactStorage
+from gummy.tools.sqlite_storage import SqliteStorage
+from gummy.tools.storage import Storage
+
+STORAGES = {'storage': Storage, 'compact': CompactStorage, 'sqlite': SqliteStorage}
+
+
+def discovery(i):
+    """host record of the i-th discovery: new hosts and new ports of the known hosts (like masscan output)"""
+    host = i // 4
+    return {'addr': f'10.{host >> 16 & 255}.{host >> 8 & 255}.{host & 255}',
+            'ports': [{'protocol': 'tcp', 'portid': str(1 + i % 4 * 1000 + i % 997), 'state': 'open'}]}
+
+
+def ingest(db, records, batch):
+    """add the records in batches, return the time per record (microseconds) for each quarter of the run"""
+    quarter = records // 4
+    marks = list()
+    start = time.perf_counter()
+    for i in range(0, records, batch):
+        db.add([discovery(n) for n in range(i, min(i + batch, records))], trusted=True)
+        done = min(i + batch, records)
+        if done // quarter > len(marks):
+            now = time.perf_counter()
+            marks.append((now - start) / quarter * 1e6)
+            start = now
+    return marks
+
+
+def main():
+    """run the benchmark with the command line parameters"""
+    args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    args.add_argument('--records', type=int, default=200000, help='number of discoveries to add')
+    args.add_argument('--batch', type=int, default=500, help='records per add call (the buffer size)')
+    args.add_argument('--storage', choices=sorted(STORAGES), default='storage')
+    args.add_argument('--no-gc', action='store_true', help='disable the cyclic garbage collector')
+    args = args.parse_args()
+
+    if args.no_gc:
+        gc.disable()
+
+    with tempfile.TemporaryDirectory() as workspace:
+        db = STORAGES[args.storage]()
+        db.attach(workspace)
+        marks = ingest(db, args.records, args.batch)
+        print(f'{args.storage}: {args.records} records in batches of {args.batch}, '
+              f'{db.get_count_host} hosts {db.get_count_socket} sockets')
+        print('us per record by quarter: ' + ' '.join(f'{mark:.1f}' for mark in marks))
+        print(f'last quarter / first quarter: {marks[-1] / marks[0]:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,9 +7,11 @@ import sys
 import gummy
 from gummy.modules.scanner import Scanner
 from gummy.tools.arg_pars import ArgPars
+from gummy.tools.compact_storage import CompactStorage
 from gummy.tools.config import Config
 from gummy.tools.log import Log
 from gummy.tools.shell import GummyShell
+from gummy.tools.sqlite_storage import SqliteStorage
 from gummy.tools.storage import Storage
 from gummy.tools.tools import get_ip
 
@@ -37,7 +39,13 @@ def run():
 
     # set logger settings
     log.initialization(config.default_config['LOGING'])
-    db = Storage()
+    storage = config.default_config['MAIN'].get('storage', 'memory')
+    if storage == 'sqlite':
+        db = SqliteStorage()
+    elif storage == 'compact':
+        db = CompactStorage()
+    else:
+        db = Storage()
     scanner = Scanner(db)
     log.info(f'Start time: {datetime.datetime.now().strftime("%Y.%m.%d %H:%M:%S")}')
 
@@ -53,8 +61,18 @@ def run():
     if args.target == 'auto':
         config.start_config.set('MASSCAN', 'target', get_ip())
 
-    # start shell
     shell = GummyShell(config=config, db=db, scanner=scanner)
+
+    # batch mode: export workspace results without starting the shell
+    if args.export:
+        if args.workspase is None:
+            log.warning('Export requires the workspace name (-w)')
+            sys.exit(1)
+        shell.f_workspase(operator=workspace)
+        shell.f_export(operator=args.export, parameter=args.output)
+        sys.exit()
+
+    # start shell
     shell()
 
 
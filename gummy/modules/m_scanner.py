@@ -1,12 +1,43 @@
 from __future__ import unicode_literals
 
 import asyncio
+import codecs
+import glob
+import json
 import locale
 import os
+import random
 import re
+import shutil
+import signal
+import struct
 import subprocess
 
+from gummy.tools import masscan_binary
 from gummy.tools.log import Log
+from gummy.tools.parser import Parser
+
+# masscan console output: the status line is redrawn with \r, discoveries end with \n
+LINE_SEPARATOR = re.compile(r'[\r\n]+')
+STATUS_REGEX = re.compile(r'(?:rate:\s*)'
+                          r'(?P<Rate>[\d.]+)'
+                          r'(?:[-,\w]+\s+)'
+                          r'(?P<Persent>[\d.]*)'
+                          r'(?:%\s*done,\s*)'
+                          r'(?P<Time>[\d:]*)'
+                          r'(?:\s*remaining,\s*found=)'
+                          r'(?P<Found>[\d]*)')
+DISCOVERED_REGEX = re.compile(r'(?:Discovered open port )'
+                              r'(?P<Port>\d+)'
+                              r'(?:/)'
+                              r'(?P<Protocol>\w+)'
+                              r'(?: on )'
+                              r'(?P<IP>[\d.]+)')
+# options that define what the gummy_scan sends (an interrupted gummy_scan is resumed only with the same values)
+SCAN_OPTIONS = {'target': '--range', 'target_exclude': '--exclude', 'port': '--ports', 'udp_port': '--udp-ports',
+                'rate': '--rate'}
+# values of paused.conf needed to continue the process: the position, the permutation and the part of the targets
+PAUSED_REGEX = re.compile(r'^(?P<key>resume-index|seed|shard)\s*=\s*(?P<value>\d+(?:/\d+)?)\s*$', re.MULTILINE)
 
 
 class Mscanner:
@@ -22,7 +53,8 @@ class Mscanner:
         self.db = db
 
         self._prog_path = prog_path
-        self._scans_path = scans_path
+        # absolute, masscan processes are started in their own directories (for paused.conf)
+        self._scans_path = os.path.abspath(scans_path)
 
         self.scan_name = None
         self.target = None
@@ -32,6 +64,10 @@ class Mscanner:
         self.udp_port = None
         self.top_ports = None
         self.rate = None
+        self.xml_output = False
+        self.shards = 1
+        self.adapters = list()
+        self.rate_controller = None
 
         self._ob_last_name = ''
         self._ox_last_name = ''
@@ -42,10 +78,30 @@ class Mscanner:
         self.ox_last_path = ''
         self.conf_last_path = ''
         self.hosts_file_last_path = ''
+        self.resume_last_path = ''
 
         self._args = []
         self.counter = 0
 
+        # live discoveries are added to the storage in batches
+        self.flush_size = 500
+        self.flush_interval = 0.25
+        self.buffer = None
+        self.parser = Parser()
+        # state of the console output processing (shared by all shards)
+        self._found_udp = 0
+        self._discovered = set()
+        # last rate reported by each process and the number of rate groups (adapters) they share
+        self._rates = dict()
+        self._rate_groups = 1
+        # common --seed of the processes of the sharded gummy_scan (the shards must use the same seed)
+        self._seed = None
+        # number of the binary files written by the processes of the current gummy_scan
+        self._part = 0
+        # state of the interrupted gummy_scan that is continued and the processes interrupted by the cancellation
+        self._resume_state = None
+        self._paused = list()
+
         self.version = ''
         self.host = {}
 
@@ -76,6 +132,12 @@ class Mscanner:
         udp_port = '443' or '80,443' or '22-25'
         top_ports = 100
         rate = 25000
+        xml_output = False (also convert the binary result to xml in the background)
+        shards = 1 (number of masscan processes, each scans its --shard x/y)
+        adapters = 'eth0,eth1' (optional, the shards are spread over the adapters)
+        the rate is shared by the shards, with adapters it is the rate of each adapter
+        rate_controller = RateController (optional, adaptive rate mode: the gummy_scan is run in chunks)
+        resume = False (continue the interrupted gummy_scan with the same name and arguments, if there is one)
         """
         self.scan_name = kwargs.get('scan_name')
         self.target = kwargs.get('target')
@@ -86,6 +148,10 @@ class Mscanner:
         self.udp_port = kwargs.get('udp_port')
         self.top_ports = kwargs.get('top_ports')
         self.rate = kwargs.get('rate')
+        self.xml_output = kwargs.get('xml_output', False)
+        self.shards = max(int(kwargs.get('shards') or 1), 1)
+        self.adapters = [a.strip() for a in (kwargs.get('adapters') or '').split(',') if a.strip()]
+        self.rate_controller = kwargs.get('rate_controller')
 
         # parse start args
         if kwargs.get('counter') and kwargs.get('counter') is not None:
@@ -97,26 +163,95 @@ class Mscanner:
                 targ = targ[:18] + '...' if len(targ) > 17 else targ
             else:
                 targ = ''
-            self._ob_last_name = f'{num}-m-{self.scan_name}-[{targ}].masscan'
-            self._ox_last_name = f'{num}-m-{self.scan_name}-[{targ}].xml'
-            self._conf_last_name = f'{num}-m-{self.scan_name}-[{targ}].conf'
-            self._hosts_file_last_name = f'{num}-m-{self.scan_name}-[{targ}].host'
-
-            self.ob_last_path = '/'.join((self._scans_path, self._ob_last_name))
-            self.ox_last_path = '/'.join((self._scans_path, self._ox_last_name))
-            self.conf_last_path = '/'.join((self._scans_path, self._conf_last_name))
-            self.hosts_file_last_path = '/'.join((self._scans_path, self._hosts_file_last_name))
+            self._set_names(f'{num}-m-{self.scan_name}-[{targ}]')
         else:
             self.log.warning('Missing required parameter: scan_name')
             return
         # generate masscan arg
         self._gen_args()
 
+        self._resume_state = None
+        if kwargs.get('resume'):
+            resume = self._find_resume()
+            if resume is not None:
+                resume_path, self._resume_state = resume
+                self._set_names(self._resume_state['name'])
+                self._args = self._resume_state['args']
+                self.log.info(f'Resume the interrupted gummy_scan {resume_path}')
+
         self.counter += 1
 
         await self._run_scan()
 
-        await self._convert_masscan_to_xml()
+        self._read_binary()
+
+        if self.xml_output:
+            # archive copy only, the results are already in the storage
+            asyncio.ensure_future(self._convert_masscan_to_xml())
+
+    def _set_names(self, name):
+        """setting the names of the gummy_scan files"""
+        self._ob_last_name = f'{name}.masscan'
+        self._ox_last_name = f'{name}.xml'
+        self._conf_last_name = f'{name}.conf'
+        self._hosts_file_last_name = f'{name}.host'
+
+        self.ob_last_path = '/'.join((self._scans_path, self._ob_last_name))
+        self.ox_last_path = '/'.join((self._scans_path, self._ox_last_name))
+        self.conf_last_path = '/'.join((self._scans_path, self._conf_last_name))
+        self.hosts_file_last_path = '/'.join((self._scans_path, self._hosts_file_last_name))
+        self.resume_last_path = '/'.join((self._scans_path, f'{name}.resume'))
+
+    @staticmethod
+    def get_resume_files(scans_path, scan_name):
+        """resume state files of the interrupted gummy_scans with this name, the newest first"""
+        pattern = f'{glob.escape(os.path.abspath(scans_path))}/[0-9][0-9][0-9]-m-{scan_name}-*.resume'
+        return sorted(glob.glob(pattern), reverse=True)
+
+    @classmethod
+    def find_resume_files(cls, scans_path, scan_name, **kwargs):
+        """
+        resume state files of the interrupted gummy_scans with this name and the same options, the newest first
+        :param kwargs: target, target_exclude, port, udp_port, rate (as for __call__, not set - not used)
+        """
+        options = {SCAN_OPTIONS[key]: str(value) for key, value in kwargs.items() if value}
+        resume_files = list()
+        for resume_path in cls.get_resume_files(scans_path, scan_name):
+            try:
+                with open(resume_path) as resume_file:
+                    args = json.load(resume_file)['args']
+            except (IOError, ValueError, KeyError):
+                continue
+            if {arg: args[i + 1] for i, arg in enumerate(args[:-1]) if arg in SCAN_OPTIONS.values()} == options:
+                resume_files.append(resume_path)
+        return resume_files
+
+    def _find_resume(self):
+        """
+        finding the interrupted gummy_scan with the same name and arguments (except the output file)
+        :return: (resume file path, resume state) or None
+        """
+        def target_args(args):
+            return [None if i > 0 and args[i - 1] == '-oB' else arg for i, arg in enumerate(args)]
+
+        for resume_path in self.get_resume_files(self._scans_path, self.scan_name):
+            try:
+                with open(resume_path) as resume_file:
+                    state = json.load(resume_file)
+            except (IOError, ValueError):
+                continue
+            if target_args(state['args']) == target_args(self._args):
+                return resume_path, state
+        return None
+
+    def _save_resume(self, state):
+        """writing the state of the interrupted gummy_scan to the workspace"""
+        try:
+            with open(self.resume_last_path, 'w') as resume_file:
+                json.dump(state, resume_file, indent=1)
+            self.log.info(f'The gummy_scan is interrupted, it can be resumed ({self.resume_last_path})')
+        except IOError as e:
+            self.log.warning(f'failed to save the resume state: {e}')
 
     def _gen_args(self):
         """generating arguments to run gummy_scan"""
@@ -133,7 +268,8 @@ class Mscanner:
             self.log.debug(f'Set: {"target":10} Value: {self.target}')
         elif self.includefile:
             self._args.append('--includefile')
-            self._args.append(self.includefile)
+            # the process is started in its own directory
+            self._args.append(os.path.abspath(self.includefile))
             self.log.debug(f'Set: {"includefile":10} Value: {self.includefile}')
         else:
             self.log.warning('Missing required parameter: target')
@@ -187,83 +323,304 @@ class Mscanner:
         self._args.append('1')
         self._args.append('--interactive')
 
-    async def _read_stream(self, stream):
-        """asynchronous output processing"""
-        res_reg_rem = re.compile(r'(?:rate:\s*)'
-                                 r'(?P<Rate>[\d.]+)'
-                                 r'(?:[-,\w]+\s+)'
-                                 r'(?P<Persent>[\d.]*)'
-                                 r'(?:%\s*done,\s*)'
-                                 r'(?P<Time>[\d:]*)'
-                                 r'(?:\s*remaining,\s*found=)'
-                                 r'(?P<Found>[\d]*)')
-
-        res_reg_dis = re.compile(r'(?:Discovered open port )'
-                                 r'(?P<Port>\d+)'
-                                 r'(?:/)'
-                                 r'(?P<Protocol>\w+)'
-                                 r'(?: on )'
-                                 r'(?P<IP>[\d.]+)')
-
-        old_line = ''
-        persent_old, found_old = 0, 0
-        mach_udp = 0
-        temp_soc_stor = list()
+    async def _read_stream(self, stream, shard=''):
+        """
+        asynchronous output processing, the output is split into lines (a chunk can end in the middle of a line)
+        :param shard: shard label for the progress messages
+        """
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors='replace')
+        tail = ''
+        status = {'shard': shard, 'line': '', 'progress': (0, 0)}
         while True:
-            line = await stream.read(n=1000)
-            if line:
-                line = line.decode(locale.getpreferredencoding(False))
-                line = line.replace('\n', '')
-                line = line.replace('\r', '')
-                if line != old_line:
-                    mach_rem = res_reg_rem.search(line)
-                    mach_dis = res_reg_dis.search(line)
-                    if mach_rem:
-                        persent_new = mach_rem.group("Persent")
-                        found_new = mach_rem.group("Found")
-                        if found_new != found_old or float(persent_new) >= float(persent_old) + 5:
-                            persent_old, found_old = persent_new, found_new
-                            self.log.info(f'[{persent_new}%] '
-                                          f'Time: {mach_rem.group("Time")} '
-                                          f'Found: {int(found_new) + mach_udp}')
-                    if mach_dis:
-                        mach_soc = [{'addr': mach_dis.group('IP'),
-                                     'ports': [{'protocol': mach_dis.group('Protocol'),
-                                                'portid': mach_dis.group('Port'),
-                                                'state': 'open'}]}]
-
-                        if mach_soc not in temp_soc_stor:  # check for duplicate records:
-                            temp_soc_stor.append(mach_soc)
-                            if mach_dis.group('Protocol') == 'udp':
-                                mach_udp += 1
-
-                            self.db + mach_soc
-
-                old_line = line
-            else:
+            chunk = await stream.read(n=65536)
+            if not chunk:
                 break
+            lines = LINE_SEPARATOR.split(tail + decoder.decode(chunk))
+            tail = lines.pop()
+            for line in lines:
+                self._read_line(line, status)
+        self._read_line(tail + decoder.decode(b'', final=True), status)
 
-    async def _run_scan(self):
-        """run a gummy_scan using arguments"""
-        self.log.debug(f'Write the command to a file {self.conf_last_path}')
-        with open(self.conf_last_path, "w") as text_file:
-            text_file.write(' '.join(self._args))
-        self.log.info('Scan start')
-        self.log.debug(f'run: {" ".join(self._args)}')
+    def _read_line(self, line, status):
+        """
+        processing one line of the console output: progress and discovered ports
+        :param status: state of the stream the line came from
+        """
+        if not line or line == status['line']:
+            return
+        status['line'] = line
+
+        mach_dis = DISCOVERED_REGEX.search(line)
+        if mach_dis:
+            socket = (mach_dis.group('IP'), mach_dis.group('Protocol'), mach_dis.group('Port'))
+            # check for duplicate records:
+            if socket not in self._discovered:
+                self._discovered.add(socket)
+                if socket[1] == 'udp':
+                    self._found_udp += 1
+                self.buffer.append({'addr': socket[0],
+                                    'ports': [{'protocol': socket[1],
+                                               'portid': socket[2],
+                                               'state': 'open'}]})
+            return
+
+        mach_rem = STATUS_REGEX.search(line)
+        if mach_rem:
+            if self.rate_controller is not None:
+                # masscan reports the rate in kpps, the controller sees the rate of all shards (per adapter)
+                self._rates[status['shard']] = float(mach_rem.group('Rate')) * 1000
+                self.rate_controller.observe(sum(self._rates.values()) / self._rate_groups)
+            persent_old, found_old = status['progress']
+            persent_new = mach_rem.group("Persent")
+            found_new = mach_rem.group("Found")
+            if found_new != found_old or float(persent_new) >= float(persent_old) + 5:
+                status['progress'] = (persent_new, found_new)
+                self.log.info(f'{status["shard"]}[{persent_new}%] '
+                              f'Time: {mach_rem.group("Time")} '
+                              f'Found: {int(found_new) + self._found_udp}')
+
+    async def _flush_buffer(self):
+        """periodic flush of buffered discoveries, so the live host/socket counters stay current"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.buffer.is_expired:
+                self.buffer.flush()
+
+    def _gen_shard_args(self, chunk=1, chunks=1, rate=None):
+        """
+        arguments of the masscan processes of one chunk: with several shards or chunks each process gets
+        --shard x/y (chunk c consists of the shards (c - 1) * shards + 1 ... c * shards) and the common --seed,
+        an adapter from the list and its own output file (the files are merged after the gummy_scan),
+        the rate is divided between the processes of the chunk that use the same adapter
+        :param rate: rate of the chunk (adaptive rate mode)
+        :return: list of (arguments, binary output path)
+        """
+        args = list(self._args)
+        if rate is None and '--rate' in args:
+            rate = args[args.index('--rate') + 1]
+        total = chunks * self.shards
+        shards = range((chunk - 1) * self.shards + 1, chunk * self.shards + 1)
+        adapters = {shard: self.adapters[(shard - 1) % len(self.adapters)] if self.adapters else None
+                    for shard in shards}
+        shard_args = list()
+        for shard in shards:
+            self._part += 1
+            ob_path = f'{self.ob_last_path}.part{self._part}'
+            shard_arg = [ob_path if arg == self.ob_last_path else arg for arg in args]
+            if rate is not None:
+                shard_rate = max(int(float(rate)) // list(adapters.values()).count(adapters[shard]), 1)
+                if '--rate' in shard_arg:
+                    shard_arg[shard_arg.index('--rate') + 1] = str(shard_rate)
+                else:
+                    shard_arg += ['--rate', str(shard_rate)]
+            if total != 1:
+                shard_arg += ['--shard', f'{shard}/{total}', '--seed', str(self._seed)]
+            if adapters[shard] is not None:
+                shard_arg += ['--adapter', adapters[shard]]
+            shard_args.append((shard_arg, ob_path))
+        return shard_args
+
+    def _gen_resume_args(self, paused):
+        """
+        arguments of the process continuing the interrupted one, it writes to a new file,
+        masscan continues the same permutation only with the same --seed and --shard
+        :param paused: {'args': arguments, 'ob_path': output file,
+                        'resume_index', 'seed', 'shard': values from paused.conf or None}
+        :return: (arguments, binary output path)
+        """
+        self._part += 1
+        ob_path = f'{self.ob_last_path}.part{self._part}'
+        args = [ob_path if arg == paused['ob_path'] else arg for arg in paused['args']]
+        for key in ('resume-index', 'seed', 'shard'):
+            value = paused.get(key.replace('-', '_'))
+            if value is None:
+                continue
+            if f'--{key}' in args:
+                # the value of the process that continued an earlier interruption is replaced
+                del args[args.index(f'--{key}'):args.index(f'--{key}') + 2]
+            args += [f'--{key}', str(value)]
+        return args, ob_path
+
+    def _merge_shards(self, ob_paths):
+        """
+        join the binary files of the processes into the gummy_scan binary file,
+        masscan and the gummy reader skip the headers of the joined files as pseudo-records
+        """
+        ob_paths = [ob_path for ob_path in ob_paths if os.path.exists(ob_path)]
+        if len(ob_paths) == 1:
+            os.replace(ob_paths[0], self.ob_last_path)
+            return
+        with open(self.ob_last_path, 'wb') as ob_file:
+            for ob_path in ob_paths:
+                with open(ob_path, 'rb') as shard_file:
+                    shutil.copyfileobj(shard_file, ob_file)
+                os.remove(ob_path)
+
+    @staticmethod
+    def _count_open(ob_paths):
+        """number of open ports in the binary files"""
+        count = 0
+        for ob_path in ob_paths:
+            if not os.path.exists(ob_path) or os.stat(ob_path).st_size == 0:
+                continue
+            try:
+                with open(ob_path, 'rb') as stream:
+                    masscan_binary.read_header(stream)
+                    count += sum(1 for port in masscan_binary.iter_ports(stream) if port[3] == 'open')
+            except (ValueError, struct.error):
+                continue
+        return count
+
+    @staticmethod
+    def _read_paused(run_dir):
+        """
+        the paused.conf that masscan writes to its working directory when interrupted
+        :return: {'resume-index': ..., 'seed': ..., 'shard': ...} (the values that were found) or None
+        """
+        try:
+            with open(os.path.join(run_dir, 'paused.conf')) as paused_file:
+                paused = {m.group('key'): m.group('value') for m in PAUSED_REGEX.finditer(paused_file.read())}
+        except IOError:
+            return None
+        return paused if 'resume-index' in paused else None
 
-        proc = await asyncio.create_subprocess_exec(*self._args,
-                                                    stdout=asyncio.subprocess.PIPE,
-                                                    stderr=asyncio.subprocess.STDOUT)
+    async def _run_processes(self, shard_args):
+        """
+        run masscan processes at the same time and read their output
+        each process works in its own directory, so that its paused.conf can be found,
+        if the run is cancelled the interrupted processes are kept in self._paused (see _gen_resume_args)
+        """
+        with open(self.conf_last_path, "a") as text_file:
+            for args, _ in shard_args:
+                text_file.write(' '.join(args) + '\n')
+
+        self._paused = list()
+        self._rates = dict()
+        self._rate_groups = len({args[args.index('--adapter') + 1] if '--adapter' in args else None
+                                 for args, _ in shard_args})
+        procs = list()
+        labels = list()
+        try:
+            for args, ob_path in shard_args:
+                self.log.debug(f'run: {" ".join(args)}')
+                os.makedirs(f'{ob_path}.run', exist_ok=True)
+                procs.append(await asyncio.create_subprocess_exec(*args,
+                                                                  cwd=f'{ob_path}.run',
+                                                                  stdout=asyncio.subprocess.PIPE,
+                                                                  stderr=asyncio.subprocess.STDOUT))
+                labels.append(f'[{args[args.index("--shard") + 1]}] ' if '--shard' in args else '')
+
+            await asyncio.gather(*(self._read_stream(proc.stdout, label) for proc, label in zip(procs, labels)))
+            await asyncio.gather(*(proc.wait() for proc in procs))
+        except asyncio.CancelledError:
+            # masscan saves paused.conf when it gets SIGINT
+            for proc in procs:
+                if proc.returncode is None:
+                    proc.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(asyncio.gather(*(proc.wait() for proc in procs)), timeout=30)
+            except asyncio.TimeoutError:
+                pass
+            for i, (args, ob_path) in enumerate(shard_args):
+                # processes that were not started yet are run from the beginning
+                proc = procs[i] if i < len(procs) else None
+                if proc is not None and proc.returncode is None:
+                    proc.kill()
+                # masscan exits normally after saving paused.conf
+                paused = self._read_paused(f'{ob_path}.run') or dict()
+                if proc is None or proc.returncode != 0 or paused:
+                    self._paused.append({'args': args,
+                                         'ob_path': ob_path,
+                                         'resume_index': paused.get('resume-index'),
+                                         'seed': paused.get('seed'),
+                                         'shard': paused.get('shard')})
+            raise
+        finally:
+            for _, ob_path in shard_args:
+                shutil.rmtree(f'{ob_path}.run', ignore_errors=True)
 
-        await asyncio.wait([self._read_stream(proc.stdout)])
-        await proc.wait()
+    async def _run_scan(self):
+        """
+        run a gummy_scan using arguments: one masscan process per shard,
+        in the adaptive rate mode the gummy_scan is run chunk by chunk with the rate chosen by the rate controller,
+        a chunk that lost results is repeated with a lower rate
+        when the gummy_scan is cancelled the state is saved to the workspace, so it can be resumed later
+        """
+        state = self._resume_state
+        if state is None:
+            state = {'name': os.path.splitext(self._ob_last_name)[0],
+                     'args': self._args,
+                     'chunk': 1,
+                     'chunks': 1 if self.rate_controller is None else self.rate_controller.chunks,
+                     'rate': None,
+                     'part': 0,
+                     'parts': list(),
+                     'paused': list(),
+                     'seed': random.randrange(1, 2 ** 31)}
+            self.log.debug(f'Write the command to a file {self.conf_last_path}')
+            open(self.conf_last_path, "w").close()
+        elif self.rate_controller is not None and state['rate'] is not None:
+            self.rate_controller.rate = state['rate']
+        self.log.info('Scan start' if self.shards == 1 else f'Scan start ({self.shards} shards)')
+
+        self._found_udp = 0
+        self._discovered = set()
+        self._part = state['part']
+        self._seed = state.setdefault('seed', random.randrange(1, 2 ** 31))
+        self.buffer = self.db.buffer(size=self.flush_size, interval=self.flush_interval, source=self.ob_last_path)
+        flusher = asyncio.ensure_future(self._flush_buffer())
+        try:
+            if state['paused']:
+                # the rest of the interrupted chunk
+                shard_args = [self._gen_resume_args(paused) for paused in state['paused']]
+                state['parts'] += [ob_path for _, ob_path in shard_args]
+                await self._run_processes(shard_args)
+                state['chunk'] += 1
+
+            while state['chunk'] <= state['chunks']:
+                rate = None if self.rate_controller is None else self.rate_controller.rate
+                state['rate'] = rate
+                shard_args = self._gen_shard_args(chunk=state['chunk'], chunks=state['chunks'], rate=rate)
+                state['parts'] += [ob_path for _, ob_path in shard_args]
+                await self._run_processes(shard_args)
+                if self.rate_controller is None:
+                    state['chunk'] += 1
+                    continue
+
+                found = self._count_open([ob_path for _, ob_path in shard_args])
+                if self.rate_controller.chunk_done(found):
+                    self.log.info(f'Chunk {state["chunk"]}/{state["chunks"]} rate: {rate} found: {found}')
+                    state['chunk'] += 1
+                else:
+                    self.log.info(f'Chunk {state["chunk"]}/{state["chunks"]} rate: {rate} found: {found} - '
+                                  f'results were lost, repeat with rate: {self.rate_controller.rate}')
+        except asyncio.CancelledError:
+            state['part'] = self._part
+            state['paused'] = self._paused
+            self._save_resume(state)
+            raise
+        finally:
+            flusher.cancel()
+            self.buffer.flush()
+
+        self._merge_shards(state['parts'])
+        if os.path.exists(self.resume_last_path):
+            os.remove(self.resume_last_path)
 
         self.log.info('Scan complete')
 
+    def _read_binary(self):
+        """read the binary result of the gummy_scan and add it to the storage"""
+        if not os.path.exists(self.ob_last_path) or os.stat(self.ob_last_path).st_size == 0:
+            self.log.warning('The file is empty')
+            return
+        count = self.db.add_iter(self.parser.iter_hosts(self.ob_last_path), source=self.ob_last_path)
+        self.db.add_scan(scan=self.parser.scan, count=count)
+
     async def _convert_masscan_to_xml(self):
         """convert masscan binary to xml format"""
 
-        if os.stat(self.ob_last_path).st_size == 0:
+        if not os.path.exists(self.ob_last_path) or os.stat(self.ob_last_path).st_size == 0:
             self.log.warning('The file is empty')
         else:
             self.log.debug(f'Сonvert {self.ob_last_path} to {self.ox_last_path}')
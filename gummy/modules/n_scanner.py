@@ -1,21 +1,36 @@
 import asyncio
+import codecs
 import locale
+import os
 import re
 import subprocess
 
 from gummy.tools.log import Log
 from gummy.tools.parser import Parser
 
+# console output lines that are logged only at the debug level
+EXCLUDE_REGEX = re.compile(r'^(?:'
+                           r'WARNING: Running Nmap setuid, as you are doing, is a major security risk\.'
+                           r'|WARNING: Running Nmap setgid, as you are doing, is a major security risk\.'
+                           r'|Starting Nmap .*'
+                           r'|'
+                           r'|Host is up\.'
+                           r'|Nmap scan report for [\d.]*'
+                           r')$')
+# a longer line without the end is logged in parts
+MAX_LINE = 65536
+
 
 class Nscanner:
     """nmap scanner module class"""
 
     # TODO the process does not end at task.cancel()
-    def __init__(self, prog_path, db, scans_path):
+    def __init__(self, prog_path, db, scans_path, version=None):
         """
         initialization nmap scanner class object
         :param prog_path: path to the program
         :param scans_path: gummy_scan directory
+        :param version: nmap version already checked by another instance (the program is not run again)
         """
         self.log = Log(name='nscan')
         self.db = db
@@ -28,13 +43,17 @@ class Nscanner:
         self.port = None
         self.udp_port = None
         self.scan_type = None
-        self.version = None
+        self.version = version
         self._ox_last_name = None
         self.ox_last_path = None
         self._t_missing = 'Missing required parameter: {}'
         self._args = list()
         self.counter = 0
-        self._check_prog()
+        # the xml output is read while nmap is running, finished hosts are added to the storage in batches
+        self.tail_interval = 0.5
+        self.flush_size = 50
+        if self.version is None:
+            self._check_prog()
 
         self._args_basic = ['-sV', '-Pn', '--disable-arp-ping', '-T4', '-O', '--version-light', '--stats-every', '1s']
         self._args_arp = ['-PR', '-sn', '--stats-every', '1s']
@@ -59,7 +78,7 @@ class Nscanner:
         :param kwargs:
         scan_name = first
         counter = 1
-        target = 10.10.1.0/16
+        target = 10.10.1.0/16 or list of targets scanned by one nmap process
         port = '443' or '80,443' or '22-25'
         udp_port = '443' or '80,443' or '22-25'
         scan_type = 'fast' or 'basic' or 'full'
@@ -74,7 +93,11 @@ class Nscanner:
         if kwargs.get('counter') and kwargs.get('counter') is not None:
             self.counter = kwargs.get('counter')
 
-        targ = self.target.replace('.', '-').replace('/', '#')
+        if isinstance(self.target, list):
+            targ = self.target[0].replace('.', '-').replace('/', '#')
+            targ = f'{targ}+{len(self.target) - 1}' if len(self.target) > 1 else targ
+        else:
+            targ = self.target.replace('.', '-').replace('/', '#')
         targ = targ[:18] + '...' if len(targ) > 17 else targ
         self._ox_last_name = f'{str(self.counter).zfill(3)}-n-{self.scan_name}-[{targ}]-{self.scan_type}.xml'
 
@@ -83,10 +106,6 @@ class Nscanner:
         if self._gen_args():
             await self._run_scan()
 
-            self.parser(self.ox_last_path)
-            # noinspection PyStatementEffect
-            self.db + self.parser.result
-
     def _gen_args(self):
         """generating arguments to run gummy_scan"""
         # clear list
@@ -97,7 +116,10 @@ class Nscanner:
         self._args.append(self._prog_path)
 
         # target
-        if self.target:
+        if isinstance(self.target, list) and self.target:
+            self._args += self.target
+            self.log.debug(f'Set: {"target":10} Value: {" ".join(self.target)}')
+        elif self.target:
             self._args.append(self.target)
             self.log.debug(f'Set: {"target":10} Value: {self.target}')
         else:
@@ -140,32 +162,72 @@ class Nscanner:
         return True
 
     async def _read_stream(self, stream):
-        """asynchronous output processing"""
-        full_body = ''
-        last_print_line = 0
-
-        exclude_lines = [r'^WARNING: Running Nmap setuid, as you are doing, is a major security risk.$',
-                         r'^WARNING: Running Nmap setgid, as you are doing, is a major security risk.$',
-                         r'^Starting Nmap .*$',
-                         r'^$',
-                         r'^Host is up.$',
-                         r'^Nmap scan report for [\d.]*$']
+        """
+        asynchronous output processing, the output is split into lines (a chunk can end in the middle of a line),
+        only the unfinished line is kept between the chunks
+        """
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors='replace')
+        tail = ''
         while True:
-            line = await stream.read(n=100)
-            if line:
-                line = line.decode(locale.getpreferredencoding(False))
-                full_body += line
-                full_body_list = full_body.split('\n')
-                total_line = len(full_body_list) - 1
-                if total_line > last_print_line:
-                    for line in full_body_list[last_print_line:total_line]:
-                        if any(re.search(regex, line) for regex in exclude_lines):
-                            self.log.debug(line)
-                        else:
-                            self.log.info(line)
-                    last_print_line = total_line
-            else:
+            chunk = await stream.read(n=65536)
+            if not chunk:
                 break
+            lines = (tail + decoder.decode(chunk)).split('\n')
+            tail = lines.pop()
+            if len(tail) > MAX_LINE:
+                lines.append(tail)
+                tail = ''
+            for line in lines:
+                self._read_line(line)
+        tail += decoder.decode(b'', final=True)
+        if tail:
+            self._read_line(tail)
+
+    def _read_line(self, line):
+        """logging one line of the console output"""
+        line = line.rstrip('\r')
+        if EXCLUDE_REGEX.match(line):
+            self.log.debug(line)
+        else:
+            self.log.info(line)
+
+    async def _tail_xml(self, finished):
+        """
+        reading the xml output while nmap is running, each host is added to the storage as soon as nmap writes it,
+        the file is not parsed again after the gummy_scan: when the whole document was read the scan is recorded,
+        a file that is not complete (the gummy_scan was interrupted) is not recorded and is parsed at the next load
+        :param finished: event set when the nmap process has exited, the rest of the file is read then
+        """
+        self.parser.feed_start(self.ox_last_path)
+        buffer = self.db.buffer(size=self.flush_size, interval=self.tail_interval, source=self.ox_last_path)
+        xml_file = None
+        try:
+            while True:
+                done = finished.is_set()
+                if xml_file is None and os.path.exists(self.ox_last_path):
+                    xml_file = open(self.ox_last_path, 'rb')
+                if xml_file is not None:
+                    for host in self.parser.feed(xml_file.read()):
+                        buffer.append(host)
+                    if buffer.fingerprint_time is None:
+                        buffer.fingerprint_time = self.db.get_scan_fingerprint_time(self.parser.scan)
+                if buffer.is_expired:
+                    buffer.flush()
+                if done:
+                    break
+                try:
+                    await asyncio.wait_for(finished.wait(), timeout=self.tail_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if xml_file is not None:
+                xml_file.close()
+            buffer.flush()
+
+        if self.parser.feed_close():
+            self.db.add_scan(scan=self.parser.scan, count=buffer.count)
+        else:
+            self.log.warning(f'{self.ox_last_path} is not complete, it will be parsed again at the next load')
 
     async def _run_scan(self):
         """run a gummy_scan using arguments"""
@@ -177,8 +239,14 @@ class Nscanner:
                                                     stdout=asyncio.subprocess.PIPE,
                                                     stderr=asyncio.subprocess.STDOUT)
 
-        await asyncio.wait([self._read_stream(proc.stdout)])
-        await proc.wait()
+        finished = asyncio.Event()
+        tail = asyncio.ensure_future(self._tail_xml(finished))
+        try:
+            await self._read_stream(proc.stdout)
+            await proc.wait()
+        finally:
+            finished.set()
+            await tail
 
         self.counter += 1
         self.log.info('Scan complete')
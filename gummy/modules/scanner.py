@@ -1,11 +1,13 @@
 import asyncio
 import datetime
+import time
 
 from gummy.modules.m_scanner import Mscanner
 from gummy.modules.n_scanner import Nscanner
 from gummy.tools.log import Log
 from gummy.tools.parser import Parser
 from gummy.tools.port_master import PortMaster
+from gummy.tools.rate_controller import RateController
 
 
 class Scanner:
@@ -41,7 +43,17 @@ class Scanner:
         self.port = None
         self.top_ports = None
         self.rate = None
+        self.xml_output = False
+        self.shards = 1
+        self.adapters = None
+        self.rate_mode = None
+        self.rate_min = None
+        self.rate_max = None
+        self.rate_chunks = None
         self.scan_type = None
+        self.nmap_workers = None
+        self.nmap_group_size = None
+        self.fingerprint_max_age = None
 
         # port ranges param:
         self.tcp_stage_1 = self.port_master(start=1, end=1000, protocol='tcp')
@@ -69,7 +81,98 @@ class Scanner:
         self.port = config['MASSCAN'].get('port')
         self.top_ports = config['MASSCAN'].get('top_ports')
         self.rate = config['MASSCAN'].get('rate')
+        self.xml_output = config['MASSCAN'].getboolean('xml_output', fallback=False)
+        self.shards = config['MASSCAN'].get('shards', '1')
+        self.adapters = config['MASSCAN'].get('adapters', '')
+        self.rate_mode = config['MASSCAN'].get('rate_mode', 'fixed')
+        self.rate_min = config['MASSCAN'].get('rate_min', '1000')
+        self.rate_max = config['MASSCAN'].get('rate_max', '100000')
+        self.rate_chunks = config['MASSCAN'].get('rate_chunks', '10')
         self.scan_type = config['NMAP'].get('scan_type')
+        self.nmap_workers = config['NMAP'].get('workers', '4')
+        self.nmap_group_size = config['NMAP'].get('group_size', '16')
+        self.fingerprint_max_age = config['NMAP'].get('fingerprint_max_age', '86400')
+
+    def new_rate_controller(self):
+        """rate controller for one masscan run in the adaptive rate mode (None in the fixed rate mode)"""
+        if self.rate_mode != 'adaptive':
+            return None
+        return RateController(min_rate=int(self.rate_min),
+                              max_rate=int(self.rate_max),
+                              chunks=max(int(self.rate_chunks), 1))
+
+    def skip_fingerprinted(self, hosts):
+        """
+        removing the open ports fingerprinted less than fingerprint_max_age seconds ago from the host records
+        :return: host records with the new and stale open ports (hosts without them are removed)
+        """
+        max_age = int(self.fingerprint_max_age)
+        if max_age <= 0:
+            return hosts
+        now = time.time()
+        result = list()
+        skipped = 0
+        for host in hosts:
+            ports = list()
+            for port in host.get('ports', list()):
+                if port['state'] == 'open':
+                    fingerprint_time = self.db.get_fingerprint_time(host['addr'], port['protocol'], port['portid'])
+                    if fingerprint_time is not None and now - fingerprint_time < max_age:
+                        skipped += 1
+                        continue
+                ports.append(port)
+            if len(ports) == len(host.get('ports', list())):
+                result.append(host)
+            elif any(port['state'] == 'open' for port in ports):
+                result.append(dict(host, ports=ports))
+        if skipped:
+            self.log.info(f'{skipped} sockets were fingerprinted less than {max_age}s ago, '
+                          f'{len(hosts) - len(result)} hosts are skipped')
+        return result
+
+    @staticmethod
+    def plan_nmap_jobs(hosts, group_size):
+        """
+        grouping the hosts with the same open ports, each group is scanned by one nmap process
+        :param hosts: host records with ports
+        :param group_size: the largest number of hosts in a group
+        :return: list of (list of addrs, tcp ports, udp ports)
+        """
+        groups = dict()
+        for host in hosts:
+            tcp = set()
+            udp = set()
+            for port in host.get('ports', list()):
+                if port['state'] == 'open':
+                    if port['protocol'] == 'tcp':
+                        tcp.add(port['portid'])
+                    elif port['protocol'] == 'udp':
+                        udp.add(port['portid'])
+            signature = (tuple(sorted(tcp, key=int)), tuple(sorted(udp, key=int)))
+            groups.setdefault(signature, list()).append(host['addr'])
+
+        jobs = list()
+        for (tcp, udp), addrs in groups.items():
+            for i in range(0, len(addrs), group_size):
+                jobs.append((addrs[i:i + group_size], list(tcp), list(udp)))
+        return jobs
+
+    async def __nmap_worker(self, n_scan, jobs):
+        """
+        worker of the step 3 pool: runs the jobs from the queue one after another
+        :param n_scan: own Nscanner of the worker
+        :param jobs: queue of (counter, list of addrs, tcp ports, udp ports)
+        """
+        while not jobs.empty():
+            counter, addrs, tcp, udp = jobs.get_nowait()
+            hosts = addrs[0] if len(addrs) == 1 else f'{addrs[0]} (+{len(addrs) - 1} hosts)'
+            self.log.info(f'{hosts} tcp:{",".join(tcp)} udp:{",".join(udp)}')
+            await n_scan(scan_name='basic',
+                         counter=counter,
+                         target=addrs,
+                         port=','.join(tcp),
+                         udp_port=','.join(udp),
+                         scan_type='basic')
 
     async def __complex(self, stage):
         """
@@ -80,9 +183,19 @@ class Scanner:
         :return:
         """
         if 1 in stage:
+            # an interrupted masscan of the first stage with the same targets is continued without confirmation
+            resume_files = Mscanner.find_resume_files(self.workspace_path, 'stage_1',
+                                                      target=self.target,
+                                                      target_exclude=self.target_exclude,
+                                                      port=self.tcp_stage_1,
+                                                      udp_port=self.udp_stage_1,
+                                                      rate=self.rate)
             if all([i is None for i in [self.complex_m_scan, self.complex_n_scan, self.complex_pars]]) \
+                    or resume_files \
                     or datetime.datetime.now() < (self.complex_confirmation_time + datetime.timedelta(seconds=10)):
                 self.complex_step2, self.complex_step3, self.complex_step4 = False, False, False
+                if resume_files:
+                    self.log.info('The first stage was partially done, it will be continued')
 
                 self.complex_n_scan = Nscanner(prog_path=self.nmap_path,
                                                scans_path=self.workspace_path,
@@ -108,15 +221,20 @@ class Scanner:
                                           target_exclude=self.target_exclude,
                                           port=self.tcp_stage_1,
                                           udp_port=self.udp_stage_1,
-                                          rate=self.rate
+                                          rate=self.rate,
+                                          xml_output=self.xml_output,
+                                          shards=self.shards,
+                                          adapters=self.adapters,
+                                          rate_controller=self.new_rate_controller(),
+                                          resume=True
                                           )
-                self.complex_pars(file=self.complex_m_scan.ox_last_path)
+                self.complex_pars(file=self.complex_m_scan.ob_last_path)
                 self.create_hosts_file(hosts=set(arp_host + self.complex_pars.hosts),
                                        file=self.complex_m_scan.hosts_file_last_path)
                 self.complex_hosts_file_last_path = self.complex_m_scan.hosts_file_last_path
                 self.complex_res = self.complex_pars.result
-                self.db + self.complex_pars.result
                 self.complex_step1 = True
+                await self.db.save_snapshot_async()
 
             else:
                 self.log.info('А complex gummy_scan has already been started, if you want to override it - '
@@ -134,44 +252,50 @@ class Scanner:
                                           target_exclude=self.target_exclude,
                                           port=self.tcp_stage_2,
                                           udp_port=self.udp_stage_2,
-                                          rate=self.rate
+                                          rate=self.rate,
+                                          xml_output=self.xml_output,
+                                          shards=self.shards,
+                                          adapters=self.adapters,
+                                          rate_controller=self.new_rate_controller(),
+                                          resume=True
                                           )
 
-                self.complex_pars(file=self.complex_m_scan.ox_last_path)
+                self.complex_pars(file=self.complex_m_scan.ob_last_path)
                 self.create_hosts_file(hosts=self.complex_pars.hosts,
                                        file=self.complex_m_scan.hosts_file_last_path)
                 self.complex_res = self.db.merge(self.complex_res,
                                                  self.complex_pars.result)
-                self.db + self.complex_pars.result
                 self.complex_step2 = True
+                await self.db.save_snapshot_async()
             else:
                 self.log.info('There are no results of the previous stage')
         if 3 in stage:
             if self.complex_step2:
                 self.log.info(f'{" STEP 3 ":#^40}')
-                self.complex_n_scan = Nscanner(prog_path=self.nmap_path,
-                                               scans_path=self.workspace_path,
-                                               db=self.db)
-
-                for host in self.complex_res:
+                # each group of hosts is a job with its own counter (output file), the results are stored per host
+                hosts = self.skip_fingerprinted(self.complex_res)
+                jobs = asyncio.Queue()
+                for addrs, tcp, udp in self.plan_nmap_jobs(hosts, max(int(self.nmap_group_size), 1)):
                     self.counter += 1
-                    tcp = list()
-                    udp = list()
-                    for port in host['ports']:
-                        if port['state'] == 'open':
-                            if port['protocol'] == 'tcp':
-                                tcp.append(port['portid'])
-                            elif port['protocol'] == 'udp':
-                                udp.append(port['portid'])
-
-                    self.log.info(f'{host["addr"]} tcp:{",".join(tcp)} udp:{",".join(udp)}')
-                    await self.complex_n_scan(scan_name='basic',
-                                              counter=self.counter,
-                                              target=host['addr'],
-                                              port=','.join(tcp),
-                                              udp_port=','.join(udp),
-                                              scan_type='basic')
+                    jobs.put_nowait((self.counter, addrs, tcp, udp))
+
+                if jobs.empty():
+                    self.log.info('All open ports were fingerprinted recently')
+                else:
+                    workers = max(min(int(self.nmap_workers), jobs.qsize()), 1)
+                    # nmap is checked once, the other workers get the version
+                    n_scans = [Nscanner(prog_path=self.nmap_path,
+                                        scans_path=self.workspace_path,
+                                        db=self.db)]
+                    n_scans += [Nscanner(prog_path=self.nmap_path,
+                                         scans_path=self.workspace_path,
+                                         db=self.db,
+                                         version=n_scans[0].version) for _ in range(workers - 1)]
+                    self.complex_n_scan = n_scans[0]
+                    self.log.info(f'{len(hosts)} hosts in {jobs.qsize()} groups, {workers} nmap processes')
+                    await asyncio.gather(*(self.__nmap_worker(n_scan, jobs) for n_scan in n_scans))
                 self.complex_step3 = True
+                await self.db.save_snapshot_async()
             else:
                 self.log.info('There are no results of the previous stage')
         if 4 in stage:
@@ -184,15 +308,20 @@ class Scanner:
                                           target_exclude=self.complex_hosts_file_last_path,
                                           port=self.tcp_stage_2,
                                           udp_port=self.udp_stage_2,
-                                          rate=self.rate
+                                          rate=self.rate,
+                                          xml_output=self.xml_output,
+                                          shards=self.shards,
+                                          adapters=self.adapters,
+                                          rate_controller=self.new_rate_controller(),
+                                          resume=True
                                           )
-                self.complex_pars(file=self.complex_m_scan.ox_last_path)
+                self.complex_pars(file=self.complex_m_scan.ob_last_path)
                 self.create_hosts_file(hosts=self.complex_pars.hosts,
                                        file=self.complex_m_scan.hosts_file_last_path)
-                self.db + self.complex_pars.result
                 self.log.info('I found something in the swamp !!!')
                 self.log.info(self.complex_pars.hosts)
                 self.complex_step4 = True
+                await self.db.save_snapshot_async()
                 self.log.info(f'{" END ":#^40}')
             else:
                 self.log.info('There are no results of the previous stage')
@@ -243,7 +372,12 @@ class Scanner:
                               target_exclude=self.target_exclude,
                               port=self.port,
                               top_ports=self.top_ports,
-                              rate=self.rate
+                              rate=self.rate,
+                              xml_output=self.xml_output,
+                              shards=self.shards,
+                              adapters=self.adapters,
+                              rate_controller=self.new_rate_controller(),
+                              resume=True
                               ))
 
     def _002_nmap(self):
@@ -18,6 +18,8 @@ class ArgPars:
         self.force = None
         self.config = None
         self.create_default_config = None
+        self.export = None
+        self.output = None
 
     def __call__(self):
         """basic class method, writes the arguments as arguments to the class"""
@@ -60,6 +62,17 @@ class ArgPars:
                             choices=['fast', 'basic', 'full'],
                             help='Nmap gummy_scan type (default basic)')
 
+        parser.add_argument('--export',
+                            action='store',
+                            dest='export',
+                            choices=['csv', 'jsonl', 'targets'],
+                            help='Load the workspace (-w), export its results and exit')
+
+        parser.add_argument('-o', '--output',
+                            action='store',
+                            dest='output',
+                            help='Export file (default: export.<format> in the workspace)')
+
         parser.add_argument('-V', '--version',
                             action='store_true',
                             dest='version',
@@ -81,6 +94,8 @@ class ArgPars:
         self.workspase = args.workspase
         self.version = args.version
         self.create_default_config = args.create_default_config
+        self.export = args.export
+        self.output = args.output
 
         for item in self.__dict__.keys():
             if item[:1] != '_':
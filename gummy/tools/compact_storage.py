@@ -0,0 +1,194 @@
+from array import array
+from bisect import bisect_left
+
+from gummy.tools.query import IpIndex, int_to_ip, ip_to_int
+from gummy.tools.storage import Storage
+
+PROTOCOLS = ('tcp', 'udp')
+STATES = ('', 'open', 'closed', 'filtered', 'unfiltered', 'open|filtered', 'closed|filtered')
+
+
+class CompactStorage(Storage):
+    """
+    storage of gummy_scan results in packed arrays, designed for very large scans
+    a socket takes 4 bytes: port (16 bits), protocol (1 bit) and state number (15 bits),
+    host records are materialized only when they are requested
+    """
+
+    def __init__(self):
+        """class initialization method"""
+        # host position -> IPv4 address as 32-bit integer (0 for other addresses)
+        self.addrs = array('I')
+        # host position -> sorted array of packed sockets: state << 17 | protocol << 16 | port
+        self.packed_sockets = list()
+        # address (integer for IPv4, string for other) -> host position
+        self.host_pos = dict()
+        # host position -> other fields of the host record (mac, hostname, vendor and non-IPv4 addr)
+        self.host_extra = dict()
+        self.states = list(STATES)
+        self.state_codes = {state: code for code, state in enumerate(self.states)}
+        self.open_count = 0
+        super().__init__()
+        self.ip_index = IpIndex(compact=True)
+
+    @property
+    def data(self):
+        """all host records (materialized from the arrays)"""
+        return list(self.iter_hosts())
+
+    @data.setter
+    def data(self, hosts):
+        """replace the contents of the storage with the host records"""
+        self.addrs = array('I')
+        self.packed_sockets = list()
+        self.host_pos = dict()
+        self.host_extra = dict()
+        self.open_count = 0
+        self.ip_index = IpIndex(compact=True)
+        self.upsert(hosts)
+
+    def clear(self):
+        """remove all results: hosts, scans and fingerprints"""
+        super().clear()
+        # the arrays and the compact address index
+        self.data = list()
+
+    @staticmethod
+    def __addr_key(addr):
+        """IPv4 address as integer, other addresses are kept as strings"""
+        key = ip_to_int(addr)
+        return addr if key is None else key
+
+    def __get_pos(self, addr):
+        """getting host position by address, new hosts are added"""
+        key = self.__addr_key(addr)
+        pos = self.host_pos.get(key)
+        if pos is None:
+            pos = len(self.addrs)
+            self.host_pos[key] = pos
+            if isinstance(key, int):
+                self.addrs.append(key)
+                self.ip_index.add(key)
+            else:
+                self.addrs.append(0)
+                self.host_extra[pos] = {'addr': addr}
+            self.packed_sockets.append(array('I'))
+        return pos
+
+    def __pack(self, port):
+        """pack port record into integer"""
+        state = port.get('state', '')
+        code = self.state_codes.get(state)
+        if code is None:
+            code = len(self.states)
+            self.states.append(state)
+            self.state_codes[state] = code
+        return code << 17 | PROTOCOLS.index(port['protocol']) << 16 | int(port['portid'])
+
+    def __unpack(self, packed):
+        """unpack integer into port record"""
+        port = {'protocol': PROTOCOLS[packed >> 16 & 1],
+                'portid': str(packed & 0xFFFF)}
+        state = self.states[packed >> 17]
+        if state:
+            port['state'] = state
+        return port
+
+    def upsert(self, hosts):
+        """merge already validated host records into the arrays (same rules as m_schema)"""
+        open_code = self.state_codes['open']
+        for host in hosts:
+            pos = self.__get_pos(host['addr'])
+            for key, value in host.items():
+                if key not in ('addr', 'ports'):
+                    self.host_extra.setdefault(pos, dict())[key] = value
+
+            sockets = self.packed_sockets[pos]
+            for port in host.get('ports', list()):
+                packed = self.__pack(port)
+                i = bisect_left(sockets, packed)
+                if i < len(sockets) and sockets[i] == packed:
+                    continue
+                sockets.insert(i, packed)
+                if packed >> 17 == open_code:
+                    self.open_count += 1
+
+    def __get_addr(self, pos):
+        """getting host address string by position"""
+        extra = self.host_extra.get(pos)
+        if extra is not None and 'addr' in extra:
+            return extra['addr']
+        return int_to_ip(self.addrs[pos])
+
+    def __make_host(self, pos):
+        """materialize host record by position"""
+        host = {'addr': self.__get_addr(pos)}
+        host.update((k, v) for k, v in self.host_extra.get(pos, dict()).items() if k != 'addr')
+        if len(self.packed_sockets[pos]) != 0:
+            host['ports'] = [self.__unpack(packed) for packed in self.packed_sockets[pos]]
+        return host
+
+    def iter_hosts(self):
+        """iterate over all host records, each one is materialized on demand"""
+        for pos in range(len(self.addrs)):
+            yield self.__make_host(pos)
+
+    def snapshot_hosts(self):
+        """
+        host records for the snapshot, called with the lock held: the arrays are copied now,
+        the records are materialized from the copies after the lock is released
+        """
+        addrs = array('I', self.addrs)
+        packed_sockets = [array('I', sockets) for sockets in self.packed_sockets]
+        host_extra = {pos: dict(extra) for pos, extra in self.host_extra.items()}
+        states = list(self.states)
+
+        def iter_hosts():
+            for pos, sockets in enumerate(packed_sockets):
+                extra = host_extra.get(pos, dict())
+                host = {'addr': extra['addr'] if 'addr' in extra else int_to_ip(addrs[pos])}
+                host.update((k, v) for k, v in extra.items() if k != 'addr')
+                if len(sockets) != 0:
+                    host['ports'] = list()
+                    for packed in sockets:
+                        port = {'protocol': PROTOCOLS[packed >> 16 & 1], 'portid': str(packed & 0xFFFF)}
+                        if states[packed >> 17]:
+                            port['state'] = states[packed >> 17]
+                        host['ports'].append(port)
+                yield host
+
+        return iter_hosts()
+
+    def get_host(self, addr):
+        """getting host record by address or None"""
+        pos = self.host_pos.get(self.__addr_key(addr))
+        return None if pos is None else self.__make_host(pos)
+
+    def get_port_hosts(self, portid, protocol=None):
+        """the compact storage has no port index, ports are checked host by host"""
+        return None
+
+    @property
+    def get_sockets(self, protocol='tcp'):
+        """property for getting sockets dict"""
+        open_code = self.state_codes['open']
+        proto = PROTOCOLS.index(protocol)
+        self.sockets = {self.__get_addr(pos): [str(p & 0xFFFF) for p in sockets
+                                               if p >> 17 == open_code and p >> 16 & 1 == proto]
+                        for pos, sockets in enumerate(self.packed_sockets)}
+        return self.sockets
+
+    @property
+    def get_host_list(self):
+        """property for getting hosts list"""
+        return [self.__get_addr(pos) for pos in range(len(self.addrs))]
+
+    @property
+    def get_count_host(self):
+        """property for getting number of host"""
+        return len(self.addrs)
+
+    @property
+    def get_count_socket(self):
+        """property for getting number of sockets"""
+        return self.open_count
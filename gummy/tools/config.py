@@ -23,6 +23,8 @@ class Config:
                      'result_path': Path(os.path.abspath(os.path.join(DIR, '../', 'scans'))),
                      'masscan_path': '/usr/bin/masscan',
                      'nmap_path': '/usr/bin/nmap',
+                     '# Storage backend: memory, compact (packed arrays for huge scans), sqlite (kept in the workspace)': None,
+                     'storage': 'memory',
                      '# Reporting:': None,
                      'rep_type': 'None'
                      },
@@ -43,9 +45,28 @@ class Config:
                         'target_exclude': '',
                         'port': '',
                         'top_ports': '',
-                        'rate': '10000'},
+                        'rate': '10000',
+                        '# Also convert the binary results to xml for the archive (in the background)': None,
+                        'xml_output': 'no',
+                        '# Number of masscan processes (--shard x/y) and the adapters they are spread over (eth0,eth1), '
+                        'the rate is divided between the processes, with adapters it is the rate of each adapter': None,
+                        'shards': '1',
+                        'adapters': '',
+                        '# Rate mode: fixed (rate) or adaptive (the highest rate between rate_min and rate_max '
+                        'without losses, the scan is run in rate_chunks chunks)': None,
+                        'rate_mode': 'fixed',
+                        'rate_min': '1000',
+                        'rate_max': '100000',
+                        'rate_chunks': '10'},
             'NMAP': {'# The second step - detailed scanning of discovered hosts': None,
-                     'scan_type': 'basic'},
+                     'scan_type': 'basic',
+                     '# Number of nmap processes run at the same time (complex scan step 3)': None,
+                     'workers': '4',
+                     '# Hosts with the same open ports are scanned by one nmap process, up to group_size hosts': None,
+                     'group_size': '16',
+                     '# Open ports fingerprinted (-sV) less than so many seconds ago are not scanned again '
+                     'in step 3 (0 - scan all open ports)': None,
+                     'fingerprint_max_age': '86400'},
         }
 
     def __add__(self, other):
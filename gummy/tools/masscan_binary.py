@@ -0,0 +1,98 @@
+import re
+import struct
+
+from gummy.tools.query import int_to_ip
+
+# the file header is a pseudo-record: type 'm', length 'a' and 'sscan/1.1\ns:<start time>\n' padded with zeros
+HEADER_SIZE = 2 + ord('a')
+HEADER_REGEX = re.compile(rb'^masscan/(?P<version>1\.\d)(?:\ns:(?P<start>\d+))?')
+
+# record types
+OPEN = 1
+CLOSED = 2
+BANNER4 = 4
+OPEN2 = 6
+CLOSED2 = 7
+
+# open/closed (format 1.0): timestamp, ip, port, reason, ttl
+STATUS = struct.Struct('!IIHBB')
+# open/closed (format 1.1): timestamp, ip, ip protocol, port, reason, ttl
+STATUS2 = struct.Struct('!IIBHBB')
+
+STATES = {OPEN: 'open', CLOSED: 'closed', OPEN2: 'open', CLOSED2: 'closed'}
+IP_PROTOCOLS = {6: 'tcp', 17: 'udp'}
+
+CHUNK_SIZE = 1 << 16
+
+
+def read_header(stream):
+    """
+    read the file header
+    :return: dict with the format version and the scan start time (string, None if it is not in the file)
+    """
+    mach = HEADER_REGEX.match(stream.read(HEADER_SIZE))
+    if not mach:
+        raise ValueError('not a masscan binary file')
+    start = mach.group('start')
+    return {'version': mach.group('version').decode(),
+            'start': start.decode() if start else None}
+
+
+def iter_records(stream, chunk_size=CHUNK_SIZE):
+    """
+    decode the records following the header, the stream is read in chunks
+    type and length are one byte, or two bytes of 7 bits each when the high bit is set
+    :return: generator of (record type, record body)
+    """
+    data = b''
+    pos = 0
+    while True:
+        if len(data) - pos < 4:
+            data = data[pos:] + stream.read(max(chunk_size, 4))
+            pos = 0
+            if not data:
+                return
+        try:
+            record_type = data[pos]
+            pos += 1
+            if record_type & 0x80:
+                record_type = (record_type & 0x7F) << 7 | data[pos] & 0x7F
+                pos += 1
+            length = data[pos]
+            pos += 1
+            if length & 0x80:
+                length = (length & 0x7F) << 7 | data[pos] & 0x7F
+                pos += 1
+        except IndexError:
+            raise ValueError('truncated record')
+        # masscan writes one byte more than the length of the banner4 records
+        if record_type == BANNER4:
+            length += 1
+
+        if len(data) - pos < length:
+            data = data[pos:] + stream.read(max(chunk_size, length))
+            pos = 0
+            if len(data) < length:
+                raise ValueError('truncated record')
+        yield record_type, data[pos:pos + length]
+        pos += length
+
+
+def iter_ports(stream):
+    """
+    port records of the file as (addr, protocol, portid, state)
+    records without a port status (banners, arp, IPv6) and other protocols are skipped
+    :return: generator of tuples
+    """
+    for record_type, body in iter_records(stream):
+        if record_type == OPEN2 or record_type == CLOSED2:
+            _, ip, ip_proto, port, _, _ = STATUS2.unpack_from(body)
+            protocol = IP_PROTOCOLS.get(ip_proto)
+        elif record_type == OPEN or record_type == CLOSED:
+            # format 1.0 did not record the protocol
+            _, ip, port, _, _ = STATUS.unpack_from(body)
+            protocol = 'tcp'
+        else:
+            continue
+        if protocol is not None:
+            yield int_to_ip(ip), protocol, str(port), STATES[record_type]
@@ -1,18 +1,27 @@
+import json
 import os
+from collections import deque
+import struct
 import xml.etree.ElementTree
 
+from gummy.tools import masscan_binary
 from gummy.tools.log import Log
 
+# increase when the records produced by the parser change, the cache of older versions is ignored
+PARSER_VERSION = 1
+CACHE_MAGIC = 'GUMMYPARS'
+CACHE_SUFFIX = '.cache'
+# number of the last scans kept in the scan catalog
+CATALOG_SIZE = 1000
+
 
 class Parser:
-    """class for parsing XML file"""
+    """class for parsing XML file (and masscan binary file)"""
 
     def __init__(self):
         """class initialization"""
         self.log = Log(name='pars ')
         self.file_path = None
-        # xml.etree.ElementTree.ElementTree object
-        self.tree = None
         # information about scanning
         self.scan = dict()
         # result current pars
@@ -21,148 +30,304 @@ class Parser:
         self.tcp_sockets = dict()
         self.udp_sockets = dict()
         self.hosts = list()
-
-        self.all_scans = list()
+        # masscan aggregation index: address -> (host record in the result, set of its port keys)
+        self.masscan_index = dict()
+        # the last file was not parsed to the end
+        self.parse_error = False
+        # state of the xml parsing: root element, host parsing function and the parser of a file still written
+        self.root = None
+        self.pars_host = None
+        self.pull_parser = None
+        # use the sidecar cache (file + CACHE_SUFFIX) in __call__
+        self.use_cache = True
+
+        # number of parsed files and information about the last of them (host data is kept only in the storage)
+        self.scan_count = 0
+        self.scan_catalog = deque(maxlen=CATALOG_SIZE)
 
     def __clear(self):
         """cleaning parser options"""
         self.file_path = None
-        self.tree = None
         self.scan = dict()
         self.result = list()
         self.hosts = list()
+        self.masscan_index = dict()
+        self.parse_error = False
+        self.root = None
+        self.pars_host = None
+        self.pull_parser = None
 
     def __get_hosts(self):
         """getting host list"""
         self.hosts = [h['addr'] for h in self.result]
 
-    def __load_file(self, file):
-        """reading the file, and getting the xml tree"""
-        self.file_path = file
-        if not os.path.exists(file):
-            self.log.warning('The file was not found!')
-            return False
-        try:
-            tree = xml.etree.ElementTree.parse(file)
-        except Exception:
-            self.log.warning('Error parsing the file')
-            return False
-        else:
-            self.tree = tree
-            return True
-
-    def __get_scan_info(self):
+    def __get_scan_info(self, root):
         """getting general information about scanning"""
         self.scan.clear()
-        self.scan['num'] = len(self.all_scans)
+        self.scan['num'] = self.scan_count
         self.scan['file'] = self.file_path
-        self.scan['scanner'] = self.tree.getroot().attrib['scanner']
-        self.scan['start'] = self.tree.getroot().attrib['start']
+        self.scan['scanner'] = root.attrib['scanner']
+        self.scan['start'] = root.attrib['start']
         if self.scan['scanner'] == 'nmap':
-            self.scan['args'] = self.tree.getroot().attrib['args']
-
-    def __pars_nmap(self):
-        """main method for parsing the results of the nmap gummy_scan"""
-        for item in self.tree.findall('host'):
-            host_addr = None
-            host_mac = None
-            host_mac_vendor = None
-            host_hostname = None
-            host_ports = list()
-
-            address = item.findall('address')
-            for adress in address:
-                if adress.attrib['addrtype'] == 'ipv4':
-                    host_addr = adress.attrib['addr']
-                elif adress.attrib['addrtype'] == 'mac':
-                    host_mac = adress.attrib['addr']
-                    if 'vendor' in adress.attrib:
-                        host_mac_vendor = adress.attrib['vendor']
-
-            hostnames = item.findall('hostnames/hostname')
-            for hostname in hostnames:
-                if hostname.attrib['type'] == 'PTR':
-                    host_hostname = hostname.attrib['name']
-
-            ports = item.findall('ports/port')
-            for port_odj in ports:
-                state_obj = port_odj.find('state')
-                host_port = {'protocol': port_odj.attrib['protocol'],
-                             'portid': port_odj.attrib['portid'],
-                             'state': state_obj.attrib['state']}
-                host_ports.append(host_port)
-
-            host = {'addr': host_addr}
-
-            if host_mac is not None:
-                host['mac'] = host_mac
-
-            if host_hostname is not None:
-                host['hostname'] = host_hostname
-
-            if host_mac_vendor is not None:
-                host['vendor'] = host_mac_vendor
-
-            if len(host_ports) != 0:
-                host['ports'] = host_ports
-
-            # is_it_arp_scan = all(i in self.scan['args'] for i in ['-PR', '-sn'])
+            self.scan['args'] = root.attrib['args']
+
+    @staticmethod
+    def __pars_nmap_host(item):
+        """parsing one host element of the nmap gummy_scan results"""
+        host_addr = None
+        host_mac = None
+        host_mac_vendor = None
+        host_hostname = None
+        host_ports = list()
+
+        address = item.findall('address')
+        for adress in address:
+            if adress.attrib['addrtype'] == 'ipv4':
+                host_addr = adress.attrib['addr']
+            elif adress.attrib['addrtype'] == 'mac':
+                host_mac = adress.attrib['addr']
+                if 'vendor' in adress.attrib:
+                    host_mac_vendor = adress.attrib['vendor']
+
+        hostnames = item.findall('hostnames/hostname')
+        for hostname in hostnames:
+            if hostname.attrib['type'] == 'PTR':
+                host_hostname = hostname.attrib['name']
+
+        ports = item.findall('ports/port')
+        for port_odj in ports:
+            state_obj = port_odj.find('state')
+            host_port = {'protocol': port_odj.attrib['protocol'],
+                         'portid': port_odj.attrib['portid'],
+                         'state': state_obj.attrib['state']}
+            host_ports.append(host_port)
+
+        host = {'addr': host_addr}
+
+        if host_mac is not None:
+            host['mac'] = host_mac
+
+        if host_hostname is not None:
+            host['hostname'] = host_hostname
+
+        if host_mac_vendor is not None:
+            host['vendor'] = host_mac_vendor
+
+        if len(host_ports) != 0:
+            host['ports'] = host_ports
+
+        return host
+
+    @staticmethod
+    def __pars_masscan_host(item):
+        """parsing one host element of the masscan gummy_scan results (masscan writes one port per element)"""
+        host_addr = item.find('address').attrib['addr']
+
+        if item.find('*/port') is not None:
+            port_odj = item.find('*/port')
+            state_obj = item.find('*/port/state')
+            host_port = {'protocol': port_odj.attrib['protocol'],
+                         'portid': port_odj.attrib['portid'],
+                         'state': state_obj.attrib['state']}
+        else:
+            host_port = dict()
 
-            is_it_dns_scan = '-sL' in self.scan['args']
+        return {'addr': host_addr,
+                'ports': [host_port]}
 
-            if is_it_dns_scan:
-                continue
+    def iter_hosts(self, file):
+        """
+        streaming parse of the file: host records are yielded as soon as their element is read,
+        parsed elements are cleared, so the memory does not depend on the file size
+        masscan records are not aggregated (one record per port), the storage merges them
+        """
+        self.__clear()
+        self.file_path = file
+        self.scan['file'] = file
+        if not os.path.exists(file):
+            self.log.warning('The file was not found!')
+            self.parse_error = True
+            return
+        if file.endswith('.masscan'):
+            yield from self.__iter_masscan_binary(file)
+            return
 
-            # if is_it_arp_scan and host_hostname is None:
-            #     continue
+        try:
+            yield from self.__iter_elements(xml.etree.ElementTree.iterparse(file, events=('start', 'end')))
+        except (xml.etree.ElementTree.ParseError, KeyError, AttributeError):
+            self.log.warning('Error parsing the file')
+            self.parse_error = True
+
+    def __iter_elements(self, events):
+        """host records from the (event, element) pairs of the xml parser"""
+        for event, elem in events:
+            if self.root is None:
+                self.root = elem
+                self.__get_scan_info(self.root)
+                if self.scan['scanner'] == 'nmap':
+                    # is_it_arp_scan = all(i in self.scan['args'] for i in ['-PR', '-sn'])
+                    is_it_dns_scan = '-sL' in self.scan['args']
+                    self.pars_host = None if is_it_dns_scan else self.__pars_nmap_host
+                elif self.scan['scanner'] == 'masscan':
+                    self.pars_host = self.__pars_masscan_host
+                else:
+                    self.log.warning('unexpected gummy_scan type!')
+            elif event == 'end' and elem.tag == 'host':
+                if self.pars_host is not None:
+                    yield self.pars_host(elem)
+                self.root.clear()
+
+    def feed_start(self, file):
+        """start incremental parsing of the xml file that is still being written (see feed)"""
+        self.__clear()
+        self.file_path = file
+        self.scan['file'] = file
+        self.pull_parser = xml.etree.ElementTree.XMLPullParser(events=('start', 'end'))
+
+    def feed(self, data):
+        """
+        parsing the next part of the file
+        :param data: bytes appended to the file since the previous call
+        :return: list of host records whose elements were closed in this part
+        """
+        if self.pull_parser is None or self.parse_error:
+            return list()
+        try:
+            self.pull_parser.feed(data)
+            return list(self.__iter_elements(self.pull_parser.read_events()))
+        except (xml.etree.ElementTree.ParseError, KeyError, AttributeError):
+            self.log.warning('Error parsing the file')
+            self.parse_error = True
+            return list()
+
+    def feed_close(self):
+        """
+        end of the incremental parsing (see feed)
+        :return: True if the whole document was read without errors
+        """
+        if self.pull_parser is None or self.parse_error:
+            return False
+        try:
+            self.pull_parser.close()
+        except xml.etree.ElementTree.ParseError:
+            self.parse_error = True
+            return False
+        return True
 
+    def __iter_masscan_binary(self, file):
+        """
+        streaming parse of the masscan binary file (-oB), records are the same as from the masscan xml,
+        so the results are available without running masscan --readscan
+        """
+        try:
+            with open(file, 'rb') as stream:
+                header = masscan_binary.read_header(stream)
+                self.scan.clear()
+                self.scan['num'] = self.scan_count
+                self.scan['file'] = file
+                self.scan['scanner'] = 'masscan'
+                self.scan['start'] = header['start']
+
+                for addr, protocol, portid, state in masscan_binary.iter_ports(stream):
+                    yield {'addr': addr,
+                           'ports': [{'protocol': protocol,
+                                      'portid': portid,
+                                      'state': state}]}
+        except (ValueError, struct.error) as e:
+            self.log.warning(f'Error parsing the file: {e}')
+            self.parse_error = True
+
+    def __pars_masscan(self, host):
+        """adding one masscan record to the result, records of the same host are combined"""
+        host_addr = host['addr']
+        host_port = host['ports'][0]
+        port_key = tuple(sorted(host_port.items()))
+
+        item = self.masscan_index.get(host_addr)
+        if item is None:
+            self.masscan_index[host_addr] = (host, {port_key})
             self.result.append(host)
+        else:
+            host_item, port_keys = item
+            # duplicate line exclusion:
+            if port_key not in port_keys:
+                port_keys.add(port_key)
+                host_item['ports'].append(host_port)
+
+    @staticmethod
+    def __cache_key(file):
+        """identity of the file and of the parser the cache was made for"""
+        stat = os.stat(file)
+        return os.path.abspath(file), stat.st_size, stat.st_mtime_ns, PARSER_VERSION
+
+    def __read_cache(self, file):
+        """
+        reading the parse result of the file from its sidecar cache (plain JSON, never executable data)
+        :return: True if the cache is valid and the result is loaded
+        """
+        cache_path = file + CACHE_SUFFIX
+        if not os.path.exists(cache_path) or not os.path.exists(file):
+            return False
+        try:
+            with open(cache_path, 'rb') as cache:
+                state = json.load(cache)
+            if not isinstance(state, dict) or state.get('magic') != CACHE_MAGIC \
+                    or state.get('key') != list(self.__cache_key(file)) \
+                    or not isinstance(state.get('scan'), dict) or not isinstance(state.get('result'), list):
+                return False
+        except Exception as e:
+            self.log.debug(f'Could not read cache {cache_path}: {e}')
+            return False
 
-    def __pars_masscan(self):
-        """main method for parsing the results of the masscan gummy_scan"""
-        for item in self.tree.findall('host'):
-
-            host_addr = item.find('address').attrib['addr']
-
-            if item.find('*/port') is not None:
-                port_odj = item.find('*/port')
-                state_obj = item.find('*/port/state')
-                host_port = {'protocol': port_odj.attrib['protocol'],
-                             'portid': port_odj.attrib['portid'],
-                             'state': state_obj.attrib['state']}
-            else:
-                host_port = dict()
-
-            host = {'addr': host_addr,
-                    'ports': [host_port]}
-
-            for host_item in self.result:
-                if host_item['addr'] == host_addr:
-                    # duplicate line exclusion:
-                    if host_port not in host_item['ports']:
-                        host_item['ports'].append(host_port)
-                    break
-                else:
-                    continue
-            else:
-                self.result.append(host)
+        self.__clear()
+        self.file_path = file
+        self.scan = state['scan']
+        self.scan['num'] = self.scan_count
+        self.result = state['result']
+        self.log.debug(f'Use cache {cache_path}')
+        return True
+
+    def __write_cache(self, file):
+        """writing the parse result of the file to its sidecar cache"""
+        cache_path = file + CACHE_SUFFIX
+        temp_path = cache_path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as cache:
+                json.dump({'magic': CACHE_MAGIC,
+                           'key': self.__cache_key(file),
+                           'scan': self.scan,
+                           'result': self.result}, cache)
+            os.replace(temp_path, cache_path)
+        except Exception as e:
+            self.log.debug(f'Could not write cache {cache_path}: {e}')
 
     def __call__(self, file):
-        """main persr call method"""
-        self.__clear()
-        self.__load_file(file=file)
-        self.__get_scan_info()
+        """main persr call method, the result of an unchanged file is taken from the cache"""
+        if not (self.use_cache and self.__read_cache(file)):
+            for host in self.iter_hosts(file):
+                if self.scan['scanner'] == 'masscan':
+                    self.__pars_masscan(host)
+                else:
+                    self.result.append(host)
+            # a file that is not complete (still written or broken) is not cached
+            if self.use_cache and not self.parse_error:
+                self.__write_cache(file)
 
-        if self.scan['scanner'] == 'nmap':
-            self.__pars_nmap()
-        elif self.scan['scanner'] == 'masscan':
-            self.__pars_masscan()
-        else:
-            self.log.warning('unexpected gummy_scan type!')
+        self.scan_catalog.append(dict(self.scan,
+                                      hosts=len(self.result),
+                                      sockets=sum(len(h.get('ports', list())) for h in self.result)))
+        self.scan_count += 1
 
-        current_scan = {'gummy_scan': self.scan,
-                        'hosts': self.result}
+        self.__get_hosts()
 
-        self.all_scans.append(current_scan)
 
-        self.__get_hosts()
+def parse_file(file):
+    """
+    parsing one file in a worker process
+    :return: host records (masscan records are combined) and information about the scan
+    """
+    # the state of the file that was parsed (it may still be written)
+    stat = os.stat(file)
+    parser = Parser()
+    parser(file)
+    return parser.result, dict(parser.scan, size=stat.st_size, mtime=stat.st_mtime_ns)
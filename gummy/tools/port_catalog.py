@@ -0,0 +1,84 @@
+import csv
+import os
+from bisect import bisect_right
+from pathlib import Path
+
+from gummy.tools.log import Log
+
+
+class PortCatalog:
+    """
+    This class keeps the reference information about ports: descriptions and nmap rating.
+    Descriptions of port ranges (like 6000-6063) are kept in an interval index,
+    so a lookup is a binary search instead of a dictionary entry for every port of the range.
+    """
+
+    def __init__(self):
+        """class initialization method, the csv files are read here"""
+        self.log = Log(name='ports')
+        self.DIR = Path(os.path.abspath(os.path.join(os.path.dirname(__file__), '../data')))
+        self.ports_des_file = Path(os.path.abspath(os.path.join(self.DIR, 'PortDescription.csv')))
+        self.ports_rating_file = Path(os.path.abspath(os.path.join(self.DIR, 'NmapPortRating.csv')))
+        # port -> list of descriptions
+        self.descriptions = dict()
+        # sorted starts of non-overlapping intervals and the descriptions of the ranges covering each of them
+        self.interval_starts = list()
+        self.interval_descriptions = list()
+        # 'port/protocol' -> rating
+        self.rating = dict()
+
+        self.__get_descriptions()
+        self.__get_rating()
+
+    def __get_descriptions(self):
+        """read the description list, split the port ranges into non-overlapping intervals"""
+        ranges = list()
+        try:
+            with open(self.ports_des_file) as csv_file:
+                for port in csv.DictReader(csv_file):
+                    if not port['Port']:
+                        continue
+                    if '-' in port['Port']:
+                        start, end = port['Port'].split('-')
+                        ranges.append((int(start), int(end), port['Description']))
+                    else:
+                        self.descriptions.setdefault(int(port['Port']), list()).append(port['Description'])
+        except (IOError, ValueError) as e:
+            self.log.warning(f'failed to read port description list! {e}')
+
+        bounds = sorted({start for start, _, _ in ranges} | {end + 1 for _, end, _ in ranges})
+        for start in bounds:
+            self.interval_starts.append(start)
+            self.interval_descriptions.append([d for s, e, d in ranges if s <= start <= e])
+
+    def __get_rating(self):
+        """read nmap port rate list"""
+        try:
+            with open(self.ports_rating_file) as csv_file:
+                for port in csv.DictReader(csv_file):
+                    self.rating[port['Port']] = port['Rate']
+        except IOError:
+            self.log.warning('failed to read nmap port rate list!')
+
+    def get_description(self, port):
+        """descriptions of the port: its own entries or, if there are none, the ranges containing it"""
+        port = int(port)
+        if port in self.descriptions:
+            return self.descriptions[port]
+        i = bisect_right(self.interval_starts, port) - 1
+        return self.interval_descriptions[i] if i >= 0 else list()
+
+    def get_rating(self, port, protocol):
+        """nmap rating of the port or '0'"""
+        return self.rating.get(f'{port}/{protocol}', '0')
+
+
+_port_catalog = None
+
+
+def get_port_catalog():
+    """the catalog is read from disk once and shared by the whole process"""
+    global _port_catalog
+    if _port_catalog is None:
+        _port_catalog = PortCatalog()
+    return _port_catalog
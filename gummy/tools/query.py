@@ -0,0 +1,125 @@
+import ipaddress
+import re
+import socket
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+
+PORT_REGEX = re.compile(r'^(?P<portid>\d+)(?:/(?P<protocol>tcp|udp))?$')
+QUERY_KEYS = ('port', 'state', 'vendor', 'hostname')
+
+
+def ip_to_int(addr):
+    """IPv4 address string as integer or None for other addresses"""
+    try:
+        return struct.unpack('!I', socket.inet_aton(addr))[0]
+    except (OSError, TypeError):
+        return None
+
+
+def int_to_ip(value):
+    """integer as IPv4 address string"""
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+def ip_sort_key(addr):
+    """sort key: IPv4 addresses in numeric order, other addresses after them"""
+    value = ip_to_int(addr)
+    return (1, 0, addr) if value is None else (0, value, '')
+
+
+class IpIndex:
+    """sorted index of IPv4 addresses kept as integers, new addresses are sorted in lazily on the next lookup"""
+
+    def __init__(self, compact=False):
+        """
+        class initialization method
+        :param compact: keep the index in packed 32-bit arrays instead of lists of int objects
+        """
+        self.compact = compact
+        self.sorted = self.__new()
+        self.pending = self.__new()
+
+    def __new(self, values=()):
+        """create a container of the configured type"""
+        return array('I', values) if self.compact else list(values)
+
+    def __len__(self):
+        """number of addresses in the index"""
+        return len(self.sorted) + len(self.pending)
+
+    def add(self, value):
+        """add an address (integer) to the index"""
+        self.pending.append(value)
+
+    def clear(self):
+        """remove all addresses"""
+        self.sorted = self.__new()
+        self.pending = self.__new()
+
+    def range(self, first, last):
+        """all addresses from first to last inclusive, in ascending order"""
+        if len(self.pending) != 0:
+            self.sorted = self.__new(sorted(chain(self.sorted, self.pending)))
+            self.pending = self.__new()
+        return self.sorted[bisect_left(self.sorted, first):bisect_right(self.sorted, last)]
+
+
+def parse_network(token):
+    """CIDR block, range of addresses (first-last) or single address as (first, last) integers"""
+    try:
+        if '-' in token:
+            first, last = token.split('-', 1)
+            first, last = int(ipaddress.IPv4Address(first)), int(ipaddress.IPv4Address(last))
+            if first > last:
+                raise ValueError(f'{token}: the first address is greater than the last')
+            return first, last
+        network = ipaddress.IPv4Network(token, strict=False)
+        return int(network.network_address), int(network.broadcast_address)
+    except ValueError as e:
+        raise ValueError(f'Invalid address, range or network: {e}')
+
+
+def parse_ports(token):
+    """port list like 80,443/tcp,161/udp as list of (portid, protocol or None)"""
+    ports = list()
+    for item in token.split(','):
+        mach = PORT_REGEX.match(item.lower())
+        if not mach:
+            raise ValueError(f'Invalid port: {item}')
+        ports.append((str(int(mach.group('portid'))), mach.group('protocol')))
+    return ports
+
+
+def parse_query(text):
+    """
+    convert the 'show host' parameter into Storage.query conditions, for example:
+    10.2.0.0/16 10.3.0.1-10.3.0.50 port 445/tcp state open vendor cisco hostname dc
+    the old wildcard syntax (192.168.1.* or 10.0.+) is still accepted,
+    ports may be given without the keyword when the protocol is set (445/tcp)
+    """
+    conditions = dict()
+    tokens = text.replace('=', ' ').split()
+    while tokens:
+        token = tokens.pop(0)
+        key = token.lower()
+        if key in QUERY_KEYS:
+            if not tokens:
+                raise ValueError(f'Value expected after "{token}"')
+            value = tokens.pop(0)
+            if key == 'port':
+                conditions.setdefault('ports', list()).extend(parse_ports(value))
+            else:
+                conditions[key] = value
+        elif PORT_REGEX.match(key) and '/' in key:
+            conditions.setdefault('ports', list()).extend(parse_ports(key))
+        elif '*' in token or '+' in token:
+            pattern = token.replace('*', r'[\d.]*').replace('+', r'[\d.]+')
+            try:
+                conditions['pattern'] = re.compile(pattern + '$')
+            except re.error:
+                raise ValueError('Invalid regexp')
+        else:
+            conditions.setdefault('networks', list()).append(parse_network(token))
+    return conditions
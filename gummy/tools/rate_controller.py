@@ -0,0 +1,114 @@
+import math
+
+
+class RateController:
+    """
+    This class chooses the masscan rate in the adaptive mode.
+    The gummy_scan is run in chunks of the same size (masscan --shard), so the chunks should find
+    about the same number of ports. After each chunk the controller gets the number of found ports:
+    if it is much lower than in the chunks scanned before, replies were lost - the rate is lowered
+    and the chunk is repeated, otherwise the rate is raised up to the lowest rate known to lose results.
+    """
+
+    def __init__(self, min_rate, max_rate, chunks=10, increase=2.0, decrease=0.5, tolerance=0.1):
+        """
+        class initialization method
+        :param min_rate: the lowest rate (packets per second), the scan starts with it
+        :param max_rate: the highest rate
+        :param chunks: number of chunks the gummy_scan is split into
+        :param increase: rate multiplier after a chunk without losses
+        :param decrease: rate multiplier after a chunk with losses (if there is no good rate yet)
+        :param tolerance: allowed relative decrease of the found ports
+        """
+        self.min_rate = min(min_rate, max_rate)
+        self.max_rate = max(min_rate, max_rate)
+        self.chunks = chunks
+        self.increase = increase
+        self.decrease = decrease
+        self.tolerance = tolerance
+
+        self.rate = self.min_rate
+        # the highest rate without losses, the lowest rate with losses and the rate masscan could not exceed
+        self.good_rate = None
+        self.lost_rate = None
+        self.send_limit = None
+        # average number of ports found in an accepted chunk
+        self.reference = None
+        self.accepted = 0
+        # the highest rate reported by masscan during the current chunk
+        self.peak_rate = 0
+        # (rate, found, accepted) of every chunk
+        self.history = list()
+
+    @property
+    def ceiling(self):
+        """the rate should stay below it (with a margin below the rate with losses, small losses are not detected)"""
+        lost_rate = None if self.lost_rate is None else int(self.lost_rate * (1 - self.tolerance))
+        return min(r for r in (self.max_rate, lost_rate, self.send_limit) if r is not None)
+
+    def observe(self, rate):
+        """live rate reported by masscan (packets per second)"""
+        self.peak_rate = max(self.peak_rate, rate)
+
+    def __is_lost(self, found):
+        """the chunk found noticeably fewer ports than the accepted chunks (allowing for the random spread)"""
+        if self.reference is None:
+            return False
+        return found < self.reference * (1 - self.tolerance) - 2 * math.sqrt(self.reference)
+
+    def __is_suspect(self, found):
+        """the chunk found fewer ports than the accepted chunks, but the difference may be random"""
+        if self.reference is None:
+            return False
+        return found < self.reference * (1 - self.tolerance)
+
+    def __slow_down(self, rate):
+        """the rate lost results: go back to the last good rate"""
+        self.lost_rate = rate if self.lost_rate is None else min(self.lost_rate, rate)
+        if self.good_rate is not None and self.good_rate < rate:
+            self.rate = self.good_rate
+        else:
+            self.rate = max(self.min_rate, int(rate * self.decrease))
+
+    def chunk_done(self, found):
+        """
+        feedback after the chunk
+        :param found: number of open ports found in the chunk
+        :return: True if the chunk is accepted, False if it should be repeated with the new rate
+        """
+        rate = self.rate
+        peak_rate, self.peak_rate = self.peak_rate, 0
+        at_min_rate = rate <= self.min_rate
+
+        if self.__is_lost(found) and not at_min_rate:
+            self.history.append((rate, found, False))
+            self.__slow_down(rate)
+            return False
+
+        self.history.append((rate, found, True))
+        if self.__is_suspect(found) and not at_min_rate:
+            # the results are kept, but the rate is not trusted
+            self.__slow_down(rate)
+            return True
+
+        self.accepted += 1
+        if self.reference is None:
+            self.reference = found
+        else:
+            self.reference += (found - self.reference) / self.accepted
+        self.good_rate = rate if self.good_rate is None else max(self.good_rate, rate)
+
+        # masscan could not send faster: there is no point in asking for more
+        if 0 < peak_rate < rate * (1 - self.tolerance):
+            self.send_limit = max(self.min_rate, int(peak_rate))
+
+        ceiling = self.ceiling
+        if rate * self.increase < ceiling:
+            self.rate = int(rate * self.increase)
+        elif self.lost_rate is None or ceiling < int(self.lost_rate * (1 - self.tolerance)):
+            self.rate = ceiling
+        elif ceiling - rate > rate * self.tolerance:
+            # between the good rate and the rate with losses: bisection
+            self.rate = int((rate + ceiling) / 2)
+        self.rate = max(self.min_rate, min(self.rate, self.max_rate))
+        return True
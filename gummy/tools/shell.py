@@ -7,6 +7,7 @@ import random
 import re
 import shutil
 import signal
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from prettytable import PrettyTable
@@ -26,7 +27,9 @@ from prompt_toolkit.styles import Style
 
 import gummy
 from gummy.tools.log import Log
-from gummy.tools.parser import Parser
+from gummy.tools.parser import Parser, parse_file
+from gummy.tools.query import parse_query
+from gummy.tools.storage import EXPORT_FORMATS
 from gummy.tools.tools import mk_dir, get_battery
 
 
@@ -110,13 +113,17 @@ class GummyShell:
 
         self.commands = {'set': self.config.get_all_start_config_key(),
                          'show': {'config': 'print curent config (takes param)',
-                                  'host': 'print host table (takes param)',
+                                  'host': 'print host table (takes param: 10.0.0.0/16 port 445/tcp vendor x)',
                                   'port': 'print port table',
                                   'task': 'print running tasks',
+                                  'stat': 'print storage statistics',
                                   'log': 'print the last n lines of the log file'},
                          'sync': {'config': 'synchronizes the configuration file'},
                          'run': self.get_scanner_methods(self.scan),
                          'workspase': self.get_all_workspase(),
+                         'export': {'csv': 'write one row per port to csv file (takes param: file)',
+                                    'jsonl': 'write host records to json lines file (takes param: file)',
+                                    'targets': 'write ip:port of open ports to text file (takes param: file)'},
                          'flush': {},
                          'kill': {},
                          'help': {},
@@ -126,6 +133,7 @@ class GummyShell:
                            'sync': self.f_sync,
                            'run': self.f_run,
                            'workspase': self.f_workspase,
+                           'export': self.f_export,
                            'flush': self.f_flush,
                            'kill': self.f_kill,
                            'help': self.f_help,
@@ -133,7 +141,7 @@ class GummyShell:
         self.grammar = compile("""
             (\s*  (?P<command>[a-z]+)   \s*) |
             (\s*  (?P<command>[a-z]+)   \s+   (?P<operator>[A-Za-z0-9_-]+)  \s*) |
-            (\s*  (?P<command>[a-z]+)   \s+   (?P<operator>[A-Za-z0-9_-]+)  \s+  (?P<parameter>[A-Za-z0-9.,-_/+*]+) \s*)
+            (\s*  (?P<command>[a-z]+)   \s+   (?P<operator>[A-Za-z0-9_-]+)  \s+  (?P<parameter>[A-Za-z0-9.,-_/+*]+(\s+[A-Za-z0-9.,-_/+*]+)*) \s*)
                             """)
         self.style = Style.from_dict({
             'command': '#216f21 bold',
@@ -171,6 +179,7 @@ class GummyShell:
         ''')
         self.prompt_str = [('class:prompt_for_input', '>>> ')]
         self.counter = 0
+        self.load_task = None
         self.sync_config_stat = 0
         # 0 - never synchronized
         # 1 - changed but not synchronized
@@ -183,6 +192,12 @@ class GummyShell:
             for line in str(self.db.get_ports_info()).split('\n'):
                 self.log.info(line)
 
+        def show_stat(self):
+            stats = self.db.validation_stats
+            self.log.info(f'hosts: {self.db.get_count_host} sockets: {self.db.get_count_socket}')
+            self.log.info(f'validations: {stats["count"]} trusted: {stats["trusted"]} failed: {stats["failed"]} '
+                          f'time: {stats["time"]:.3f}s')
+
         def show_task(self):
             for item_task in asyncio.Task.all_tasks():
                 self.log.info('-' * 50)
@@ -222,23 +237,14 @@ class GummyShell:
             if pr:
                 pp = pprint.PrettyPrinter(width=80)
 
-                pr = pr.replace('*', '[\d.]*')
-                pr = pr.replace('+', '[\d.]+')
-                pr = ''.join([pr, '$'])
                 try:
-                    regex = re.compile(pr)
-                except Exception:
-                    self.log.warning('Invalid regexp')
+                    conditions = parse_query(pr)
+                except ValueError as e:
+                    self.log.warning(e)
                 else:
-                    for host in self.db.data:
-                        try:
-                            search = regex.search(host['addr'])
-                        except Exception:
-                            search = False
-                            self.log.warning('Invalid regexp')
-                        if search:
-                            for line in pp.pformat(host).split('\n'):
-                                self.log.info(line)
+                    for host in self.db.query(**conditions):
+                        for line in pp.pformat(host).split('\n'):
+                            self.log.info(line)
             else:
                 for line in str(self.db.get_table()).split('\n'):
                     self.log.info(line)
@@ -255,6 +261,8 @@ class GummyShell:
                 show_task(self)
             elif op == 'port':
                 show_port(self)
+            elif op == 'stat':
+                show_stat(self)
         else:
             self.log.info('What to show?')
             self.log.info(', '.join(self.commands.get('show')))
@@ -272,6 +280,7 @@ class GummyShell:
                 self.config.start_config.set('MAIN', 'start_config_path', start_config_path)
                 mk_dir(result_path)
                 mk_dir(workspace_path)
+                self.db.attach(workspace_path)
                 # create starting config file
                 self.config.start_config_path = start_config_path
                 self.config.create_start_config()
@@ -314,6 +323,9 @@ class GummyShell:
 
     def f_workspase(self, **kwargs):
         if kwargs.get('operator'):
+            if self.load_task is not None and not self.load_task.done():
+                self.log.warning('The workspace is still loading')
+                return
             op = kwargs.get('operator')
             result_path = self.config.start_config['MAIN']['result_path']
             workspase_path = f'{result_path}/{op}'
@@ -326,18 +338,80 @@ class GummyShell:
             workspase_config_path = f'{workspase_path}/start_config.ini'
             self.log.info(f'Read workspase config: {workspase_config_path}')
             self.config.read_start_config(file=workspase_config_path)
+            self.db.attach(workspase_path)
+            if self.db.load_snapshot() is not None:
+                self.log.info(f'Load storage snapshot: {self.db.snapshot_path}')
 
-            self.log.info('Load gummy_scan results:')
+            files = list()
             for scaner in ['m', 'n']:
-                for file in self.get_xml_files(scan_path=workspase_path, scaner=scaner):
-                    self.log.info(f' -- {file}')
-                    self.parser(file)
-                    self.db + self.parser.result
+                for file in self.get_scan_files(scan_path=workspase_path, scaner=scaner):
+                    # a file written after its results were added (size or time changed) is parsed again
+                    if self.db.is_loaded(file):
+                        self.log.debug(f' -- {file} (already in storage)')
+                        continue
+                    files.append(file)
+
+            loop = asyncio.get_event_loop()
+            if loop.is_running():
+                # the shell stays responsive, the results appear in the storage as they are parsed
+                self.load_task = asyncio.ensure_future(self.load_scan_files(files))
+            else:
+                loop.run_until_complete(self.load_scan_files(files))
 
         else:
             self.log.info('What workspace to load?')
             self.log.info(', '.join(self.get_all_workspase()))
 
+    async def load_scan_files(self, files):
+        """
+        parsing the files in worker processes,
+        the results are added to the storage in the order of the files, as with sequential loading
+        (a file parsed early waits for the files before it),
+        when the loading is cancelled the files that are not parsed yet are dropped without waiting
+        """
+        self.log.info(f'Load gummy_scan results: {len(files)} files')
+        if len(files) != 0:
+            loop = asyncio.get_event_loop()
+            executor = ProcessPoolExecutor(max_workers=min(len(files), os.cpu_count() or 1))
+            futures = [loop.run_in_executor(executor, parse_file, file) for file in files]
+            try:
+                for num, (file, future) in enumerate(zip(files, futures), 1):
+                    try:
+                        hosts, scan = await future
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        self.log.warning(f'failed to parse {file}: {e}')
+                        continue
+                    self.db.add(hosts, trusted=True, scan=scan)
+                    self.log.info(f' -- [{num}/{len(files)}] {file} (hosts: {len(hosts)})')
+            finally:
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=False)
+            await self.db.save_snapshot_async()
+        self.log.info('Workspace loaded')
+
+    def f_export(self, **kwargs):
+        if kwargs.get('operator'):
+            fmt = kwargs.get('operator')
+            path = kwargs.get('parameter')
+            if not path:
+                workspace_path = self.config.start_config['MAIN'].get('workspace_path')
+                if not workspace_path:
+                    self.log.warning('Workspace is not synchronized, set the output file')
+                    return
+                path = f'{workspace_path}/export.{EXPORT_FORMATS[fmt]}'
+            try:
+                count = self.db.export(fmt=fmt, path=path)
+            except IOError as e:
+                self.log.warning(e)
+            else:
+                self.log.info(f'{count} lines written to {path}')
+        else:
+            self.log.info('What format to export?')
+            self.log.info(', '.join(self.commands.get('export')))
+
     def f_kill(self):
         for item_task in asyncio.Task.all_tasks():
             if '<Task pending coro=<GummyShell.start()' not in str(item_task):
@@ -372,21 +446,30 @@ class GummyShell:
     @staticmethod
     def get_max_scans(path):
         """workspase function, updates the gummy_scan counter"""
-        xml_files = glob.glob(pathname=f'{path}/[0-9][0-9][0-9]-[nm]-*.xml')
+        scan_files = glob.glob(pathname=f'{path}/[0-9][0-9][0-9]-[nm]-*.xml') + \
+            glob.glob(pathname=f'{path}/[0-9][0-9][0-9]-m-*.masscan') + \
+            glob.glob(pathname=f'{path}/[0-9][0-9][0-9]-m-*.resume')
         regex = re.compile(f'^{path}/(?P<num>[0-9]{"{3}"}).*$')
         nums = [0]
-        for file in xml_files:
+        for file in scan_files:
             remach = regex.match(file)
             if remach:
                 nums.append(int(remach.group('num')))
         return max(nums)
 
     @staticmethod
-    def get_xml_files(scan_path, scaner):
-        """workspase function, getting all gummy_scan results in a directory"""
-        xml_files = glob.glob(pathname=f'{scan_path}/[0-9][0-9][0-9]-{scaner}-*.xml')
-        xml_files.sort()
-        return xml_files
+    def get_scan_files(scan_path, scaner):
+        """
+        workspase function, getting all gummy_scan results in a directory
+        masscan results are read from the binary file, the xml is used if there is no binary file
+        """
+        scan_files = glob.glob(pathname=f'{scan_path}/[0-9][0-9][0-9]-{scaner}-*.xml')
+        if scaner == 'm':
+            binary_files = glob.glob(pathname=f'{scan_path}/[0-9][0-9][0-9]-m-*.masscan')
+            binary_names = {os.path.splitext(file)[0] for file in binary_files}
+            scan_files = binary_files + [f for f in scan_files if os.path.splitext(f)[0] not in binary_names]
+        scan_files.sort()
+        return scan_files
 
     def get_all_workspase(self):
         """workspase function, used to generate shell subcommands for workspase command"""
@@ -398,8 +481,8 @@ class GummyShell:
 
             for i, w in enumerate(subfolders):
                 w_name = w[len(result_path) + 1:]
-                m_len = len(self.get_xml_files(scan_path=w, scaner='m'))
-                n_len = len(self.get_xml_files(scan_path=w, scaner='n'))
+                m_len = len(self.get_scan_files(scan_path=w, scaner='m'))
+                n_len = len(self.get_scan_files(scan_path=w, scaner='n'))
                 commands[w_name] = f'scans: m[{m_len}], n[{n_len}]'
         return commands
 
@@ -513,6 +596,11 @@ class GummyShell:
         shell_task = asyncio.gather(self.start())
         with patch_stdout():
             loop.run_until_complete(shell_task)
-            for task in asyncio.Task.all_tasks(loop=loop):
-                if task is not asyncio.Task.current_task():
-                    task.cancel()
+            pending = [task for task in asyncio.Task.all_tasks(loop=loop) if not task.done()]
+            for task in pending:
+                task.cancel()
+            # let the cancelled scans stop their processes and save the resume state
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            # the snapshot is written once per stage of the complex scan, the rest is saved at exit
+            self.db.save_snapshot()
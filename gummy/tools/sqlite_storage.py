@@ -0,0 +1,269 @@
+import os
+import sqlite3
+
+from gummy.tools.query import ip_to_int
+from gummy.tools.storage import Storage
+
+
+class SqliteStorage(Storage):
+    """storage of gummy_scan results in a SQLite database inside the workspace directory"""
+
+    def __init__(self, file_name='gummy.sqlite'):
+        """
+        class initialization method
+        until the storage is attached to the workspace the database is kept in memory
+        :param file_name: name of the database file in the workspace directory
+        """
+        self.file_name = file_name
+        self.db_path = None
+        self.conn = self.__connect(':memory:')
+        super().__init__()
+
+    @staticmethod
+    def __connect(path):
+        """open the database and create the tables if they do not exist"""
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS hosts (
+                    id INTEGER PRIMARY KEY,
+                    addr TEXT NOT NULL UNIQUE,
+                    ip INTEGER,
+                    mac TEXT,
+                    hostname TEXT,
+                    vendor TEXT);
+                CREATE TABLE IF NOT EXISTS ports (
+                    id INTEGER PRIMARY KEY,
+                    addr TEXT NOT NULL,
+                    protocol TEXT NOT NULL,
+                    portid TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT '',
+                    UNIQUE (addr, protocol, portid, state));
+                CREATE TABLE IF NOT EXISTS scans (
+                    file TEXT PRIMARY KEY,
+                    num INTEGER,
+                    scanner TEXT,
+                    start TEXT,
+                    args TEXT,
+                    hosts INTEGER,
+                    size INTEGER,
+                    mtime INTEGER);
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    addr TEXT NOT NULL,
+                    protocol TEXT NOT NULL,
+                    portid TEXT NOT NULL,
+                    time INTEGER NOT NULL,
+                    PRIMARY KEY (addr, protocol, portid));
+                CREATE INDEX IF NOT EXISTS ports_port ON ports (portid, protocol);
+                CREATE INDEX IF NOT EXISTS ports_state ON ports (state);
+            ''')
+            # databases created before the ip column was added
+            if 'ip' not in [row[1] for row in conn.execute('PRAGMA table_info(hosts)')]:
+                conn.execute('ALTER TABLE hosts ADD COLUMN ip INTEGER')
+                conn.executemany('UPDATE hosts SET ip = ? WHERE addr = ?',
+                                 [(ip_to_int(row[0]), row[0]) for row in conn.execute('SELECT addr FROM hosts')])
+            conn.execute('CREATE INDEX IF NOT EXISTS hosts_ip ON hosts (ip)')
+            # databases created before the state of the scan files was kept (the files are parsed again)
+            scan_columns = [row[1] for row in conn.execute('PRAGMA table_info(scans)')]
+            for column in ('size', 'mtime'):
+                if column not in scan_columns:
+                    conn.execute(f'ALTER TABLE scans ADD COLUMN {column} INTEGER')
+        return conn
+
+    @property
+    def data(self):
+        """all host records (materialized from the database)"""
+        return list(self.iter_hosts())
+
+    @data.setter
+    def data(self, hosts):
+        """replace the contents of the storage with the host records"""
+        with self.conn:
+            self.conn.execute('DELETE FROM ports')
+            self.conn.execute('DELETE FROM hosts')
+        self.upsert(hosts)
+
+    def attach(self, workspace_path):
+        """
+        switch the storage to the database file of the workspace,
+        only the results already in the file are used (nothing is copied from the previous database),
+        the database is persistent itself so no snapshot is written
+        """
+        workspace_path = os.path.abspath(workspace_path)
+        db_path = os.path.join(workspace_path, self.file_name)
+        if db_path == self.db_path:
+            return
+        self.conn.close()
+        self.conn = self.__connect(db_path)
+        self.db_path = db_path
+        self.workspace_path = workspace_path
+        self.log.debug(f'Use database {db_path}')
+
+    def clear(self):
+        """remove all results from the database: hosts, scans and fingerprints"""
+        super().clear()
+        with self.conn:
+            self.conn.execute('DELETE FROM fingerprints')
+
+    def close(self):
+        """close the database connection"""
+        self.conn.close()
+
+    def upsert(self, hosts):
+        """merge already validated host records into the database in one transaction"""
+        host_rows = list()
+        port_rows = list()
+        for host in hosts:
+            host_rows.append((host.get('mac'), host.get('hostname'), host.get('vendor'), host['addr']))
+            for port in host.get('ports', list()):
+                port_rows.append((host['addr'], port['protocol'], port['portid'], port.get('state', '')))
+
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO hosts (addr, ip) VALUES (?, ?)',
+                                  ((row[-1], ip_to_int(row[-1])) for row in host_rows))
+            self.conn.executemany('UPDATE hosts SET mac = coalesce(?, mac), '
+                                  'hostname = coalesce(?, hostname), '
+                                  'vendor = coalesce(?, vendor) '
+                                  'WHERE addr = ?', host_rows)
+            self.conn.executemany('INSERT OR IGNORE INTO ports (addr, protocol, portid, state) VALUES (?, ?, ?, ?)',
+                                  port_rows)
+
+    def add_scan(self, scan, count):
+        """
+        remember that the results of the scan file are in the database (by the absolute path of the file),
+        with the size and the modification time of the file
+        """
+        size, mtime = self.file_stat(scan)
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO scans (file, num, scanner, start, args, hosts, size, mtime) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (os.path.abspath(scan['file']), scan.get('num'), scan.get('scanner'),
+                               scan.get('start'), scan.get('args'), count, size, mtime))
+
+    def is_loaded(self, file):
+        """the results of the file are in the database and the file has not changed since they were added"""
+        row = self.conn.execute('SELECT size, mtime FROM scans WHERE file = ?', (os.path.abspath(file),)).fetchone()
+        return row is not None and row[0] is not None and row == self.file_stat({'file': file})
+
+    def __upsert_fingerprints(self, rows):
+        """store (addr, protocol, portid, time) rows, the later time of a socket is kept"""
+        rows = list(rows)
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO fingerprints (addr, protocol, portid, time) '
+                                  'VALUES (?, ?, ?, ?)', rows)
+            self.conn.executemany('UPDATE fingerprints SET time = max(time, ?) '
+                                  'WHERE addr = ? AND protocol = ? AND portid = ?',
+                                  ((row[3], row[0], row[1], row[2]) for row in rows))
+
+    def add_fingerprints(self, hosts, fingerprint_time):
+        """remember when the open ports of the hosts were fingerprinted (in the database)"""
+        self.__upsert_fingerprints((host['addr'], port['protocol'], port['portid'], fingerprint_time)
+                                   for host in hosts for port in host.get('ports', list())
+                                   if port.get('state') == 'open')
+
+    def get_fingerprint_time(self, addr, protocol, portid):
+        """time of the last fingerprint of the socket (seconds since the epoch) or None"""
+        row = self.conn.execute('SELECT time FROM fingerprints WHERE addr = ? AND protocol = ? AND portid = ?',
+                                (addr, protocol, portid)).fetchone()
+        return None if row is None else row[0]
+
+    @property
+    def scans(self):
+        """file name -> information about the scan whose results are in the database"""
+        columns = ('file', 'num', 'scanner', 'start', 'args', 'hosts', 'size', 'mtime')
+        cursor = self.conn.execute(f'SELECT {", ".join(columns)} FROM scans ORDER BY file')
+        return {row[0]: dict(zip(columns, row)) for row in cursor}
+
+    @scans.setter
+    def scans(self, scans):
+        """replace the list of added scans"""
+        with self.conn:
+            self.conn.execute('DELETE FROM scans')
+        for scan in scans.values():
+            self.add_scan(scan=scan, count=scan['hosts'])
+
+    @staticmethod
+    def __make_host(row):
+        """host record from the hosts table row"""
+        host = {'addr': row[0]}
+        for key, value in zip(('mac', 'hostname', 'vendor'), row[1:4]):
+            if value is not None:
+                host[key] = value
+        return host
+
+    @staticmethod
+    def __make_port(protocol, portid, state):
+        """port record from the ports table columns"""
+        port = {'protocol': protocol, 'portid': portid}
+        if state:
+            port['state'] = state
+        return port
+
+    def iter_hosts(self):
+        """iterate over all host records, the ports are read in the same query"""
+        cursor = self.conn.execute('SELECT h.addr, h.mac, h.hostname, h.vendor, p.protocol, p.portid, p.state '
+                                   'FROM hosts h LEFT JOIN ports p ON p.addr = h.addr '
+                                   'ORDER BY h.id, p.id')
+        host = None
+        for row in cursor:
+            if host is None or host['addr'] != row[0]:
+                if host is not None:
+                    yield host
+                host = self.__make_host(row)
+            if row[4] is not None:
+                host.setdefault('ports', list()).append(self.__make_port(*row[4:]))
+        if host is not None:
+            yield host
+
+    def get_host(self, addr):
+        """getting host record by address or None"""
+        row = self.conn.execute('SELECT addr, mac, hostname, vendor FROM hosts WHERE addr = ?', (addr,)).fetchone()
+        if row is None:
+            return None
+        host = self.__make_host(row)
+        ports = [self.__make_port(*p) for p in self.conn.execute(
+            'SELECT protocol, portid, state FROM ports WHERE addr = ? ORDER BY id', (addr,))]
+        if ports:
+            host['ports'] = ports
+        return host
+
+    def iter_addr_range(self, first, last):
+        """iterate over addresses of the hosts from first to last (integers) inclusive"""
+        cursor = self.conn.execute('SELECT addr FROM hosts WHERE ip BETWEEN ? AND ? ORDER BY ip', (first, last))
+        return (row[0] for row in cursor)
+
+    def get_port_hosts(self, portid, protocol=None):
+        """getting the set of hosts on which the port is open (protocol None - both)"""
+        cursor = self.conn.execute('SELECT addr FROM ports WHERE portid = ? AND state = ? '
+                                   'AND (? IS NULL OR protocol = ?)', (portid, 'open', protocol, protocol))
+        return {row[0] for row in cursor}
+
+    @property
+    def get_sockets(self, protocol='tcp'):
+        """property for getting sockets dict"""
+        self.sockets = dict()
+        cursor = self.conn.execute('SELECT h.addr, p.portid FROM hosts h '
+                                   'LEFT JOIN ports p ON p.addr = h.addr AND p.protocol = ? AND p.state = ? '
+                                   'ORDER BY h.id, p.id', (protocol, 'open'))
+        for addr, portid in cursor:
+            ports = self.sockets.setdefault(addr, list())
+            if portid is not None:
+                ports.append(portid)
+        return self.sockets
+
+    @property
+    def get_host_list(self):
+        """property for getting hosts list"""
+        return [row[0] for row in self.conn.execute('SELECT addr FROM hosts ORDER BY id')]
+
+    @property
+    def get_count_host(self):
+        """property for getting number of host"""
+        return self.conn.execute('SELECT count(*) FROM hosts').fetchone()[0]
+
+    @property
+    def get_count_socket(self):
+        """property for getting number of sockets"""
+        return self.conn.execute('SELECT count(*) FROM ports WHERE state = ?', ('open',)).fetchone()[0]
@@ -1,13 +1,65 @@
+import asyncio
 import csv
+import json
 import os
-from pathlib import Path
+import threading
+import time
 
-import objectpath
 from jsonmerge import Merger
-from jsonschema import validate, FormatChecker
+from jsonschema import Draft4Validator, FormatChecker
 from prettytable import PrettyTable
 
 from gummy.tools.log import Log
+from gummy.tools.port_catalog import get_port_catalog
+from gummy.tools.query import IpIndex, int_to_ip, ip_sort_key, ip_to_int
+
+# the snapshot is JSON Lines (data only, it is safe to open a workspace from someone else):
+# the header line, then one {"scan": ...}, {"host": ...} or {"fingerprint": [addr, protocol, portid, time]} per line
+SNAPSHOT_MAGIC = 'GUMMYSNAP'
+SNAPSHOT_VERSION = 3
+# export format -> default file extension
+EXPORT_FORMATS = {'csv': 'csv', 'jsonl': 'jsonl', 'targets': 'txt'}
+
+
+class StorageBuffer:
+    """this class collects host records and adds them to the storage in batches (by size or by time)"""
+
+    def __init__(self, db, size, interval, trusted, source=None, fingerprint_time=None):
+        """class initialization method"""
+        self.db = db
+        self.size = size
+        self.interval = interval
+        self.trusted = trusted
+        self.source = source
+        # start of the nmap service scan the records come from (see Storage.get_scan_fingerprint_time)
+        self.fingerprint_time = fingerprint_time
+        self.records = list()
+        # number of records appended to the buffer
+        self.count = 0
+        self.last_flush = time.monotonic()
+
+    def __len__(self):
+        """number of records waiting to be added"""
+        return len(self.records)
+
+    def append(self, host):
+        """add the host record to the buffer, flush the buffer if it is full or too old"""
+        self.records.append(host)
+        self.count += 1
+        if len(self.records) >= self.size or self.is_expired:
+            self.flush()
+
+    @property
+    def is_expired(self):
+        """more than interval seconds have passed since the last flush"""
+        return time.monotonic() - self.last_flush >= self.interval
+
+    def flush(self):
+        """add all buffered records to the storage in one call"""
+        if self.records:
+            self.db.add(self.records, trusted=self.trusted, source=self.source, fingerprint_time=self.fingerprint_time)
+            self.records = list()
+        self.last_flush = time.monotonic()
 
 
 class Storage:
@@ -16,8 +68,28 @@ class Storage:
     def __init__(self):
         """class initialization method"""
         self.log = Log(name='storg')
+        # held while the results are changed or copied for the snapshot (the snapshot is written in a thread)
+        self.lock = threading.RLock()
+        # one snapshot is written at a time
+        self.snapshot_lock = threading.Lock()
         self.data = list()
         self.sockets = dict()
+        # addr -> host record (the same objects that are stored in data)
+        self.host_index = dict()
+        # (protocol, portid) -> set of addr on which this port is open
+        self.port_index = dict()
+        # addr -> set of port ids already stored for the host
+        self.host_port_index = dict()
+        # sorted IPv4 addresses of all hosts (as integers)
+        self.ip_index = IpIndex()
+        # file name -> information about the scan whose results were added
+        self.scans = dict()
+        # (addr, protocol, portid) -> time of the last nmap service scan (-sV) of the open port
+        self.fingerprints = dict()
+        self.snapshot_name = 'storage.snapshot'
+        self.snapshot_path = None
+        # absolute path of the workspace the results belong to
+        self.workspace_path = None
         self.last_received = None
         self.v_schema = {
             "$schema": "http://json-schema.org/draft-04/schema#",
@@ -55,6 +127,10 @@ class Storage:
             "type": "array",
             "items": {"$ref": "#/definitions/host"}
         }
+        self.validator = Draft4Validator(self.v_schema, format_checker=FormatChecker())
+        # count - full validations, trusted - cheap structural checks, failed - dropped host records,
+        # time - total seconds spent
+        self.validation_stats = {'count': 0, 'trusted': 0, 'failed': 0, 'time': 0.0}
         self.m_schema = {'mergeStrategy': 'arrayMergeById',
                          'mergeOptions': {'idRef': 'addr'},
                          "items": {"properties": {"ports": {'mergeStrategy': 'arrayMergeById',
@@ -63,84 +139,500 @@ class Storage:
                                                   }
                                    }
                          }
-        self.DIR = Path(os.path.abspath(os.path.join(os.path.dirname(__file__), '../data')))
-        self.ports_des_file = Path(os.path.abspath(os.path.join(self.DIR, 'PortDescription.csv')))
-        self.ports_rating_file = Path(os.path.abspath(os.path.join(self.DIR, 'NmapPortRating.csv')))
-        self.ports_des = None
-        self.__get_ports_des()
-
-    def __validate_scan_res(self):
-        """received object validation method"""
+        self.port_catalog = get_port_catalog()
+
+    def __validate_scan_res(self, obj, trusted=False, source=None):
+        """
+        received object validation method, invalid host records are dropped one by one
+        :param source: where the records came from (for the log)
+        :return: list of the valid host records or None if the object is not a list
+        """
+        start = time.perf_counter()
         try:
-            validate(self.last_received, self.v_schema, format_checker=FormatChecker())
-            return True
-        except Exception as e:
-            self.log.warning(e)
-            return False
+            if not isinstance(obj, list):
+                self.validation_stats['failed'] += 1
+                self.log.warning(f'{source or "received object"}: {obj!r:.100} is not of type list')
+                return None
+            if trusted:
+                self.validation_stats['trusted'] += 1
+                errors = dict()
+                for i, host in enumerate(obj):
+                    error = self.__check_host(host)
+                    if error is not None:
+                        errors[i] = error
+            else:
+                self.validation_stats['count'] += 1
+                errors = dict()
+                for error in self.validator.iter_errors(obj):
+                    errors.setdefault(error.path[0] if error.path else None, error.message)
+                if None in errors:
+                    self.validation_stats['failed'] += 1
+                    self.log.warning(f'{source or "received object"}: {errors[None]}')
+                    return None
+            if not errors:
+                return obj
+            self.validation_stats['failed'] += len(errors)
+            self.log.warning(f'{source or "received object"}: {len(errors)} of {len(obj)} host records are invalid '
+                             f'and dropped, the first: {next(iter(errors.values()))}')
+            return [host for i, host in enumerate(obj) if i not in errors]
+        finally:
+            self.validation_stats['time'] += time.perf_counter() - start
+
+    @staticmethod
+    def __check_host(host):
+        """
+        cheap structural check of one record produced by gummy itself (Parser, Mscanner)
+        :return: error message or None
+        """
+        if not isinstance(host, dict) or not isinstance(host.get('addr'), str):
+            return f'{host!r:.100} has no valid addr'
+        ports = host.get('ports', list())
+        if not isinstance(ports, list):
+            return f'{host["addr"]}: invalid ports {ports!r:.100}'
+        for port in ports:
+            if not isinstance(port, dict) or port.get('protocol') not in ('tcp', 'udp') or 'portid' not in port:
+                return f'{host["addr"]}: invalid port {port!r:.100}'
+        return None
 
     def __merge_scan_res(self):
         """merge of the received object with the main storage"""
-        merger = Merger(self.m_schema)
-        self.data = merger.merge(self.data, self.last_received)
+        self.upsert(self.last_received)
+
+    def upsert(self, hosts):
+        """merge already validated host records into the main storage"""
+        for host in hosts:
+            self.__upsert_host(host)
+
+    def __upsert_host(self, host):
+        """
+        merge one host record into the main storage and update the indexes
+        the rules are the same as in m_schema: addr is the host id, the whole port dict is the port id
+        :param host: host record
+        """
+        addr = host['addr']
+        stored = self.host_index.get(addr)
+        if stored is None:
+            stored = dict()
+            self.data.append(stored)
+            self.host_index[addr] = stored
+            self.host_port_index[addr] = set()
+            ip = ip_to_int(addr)
+            if ip is not None:
+                self.ip_index.add(ip)
+
+        for key, value in host.items():
+            if key != 'ports':
+                stored[key] = value
+
+        if 'ports' in host:
+            stored_ports = stored.setdefault('ports', list())
+            port_ids = self.host_port_index[addr]
+            for port in host['ports']:
+                port_id = tuple(sorted(port.items()))
+                if port_id in port_ids:
+                    continue
+                port_ids.add(port_id)
+                stored_ports.append(dict(port))
+                if port.get('state') == 'open':
+                    self.port_index.setdefault((port['protocol'], port['portid']), set()).add(addr)
+
+    @staticmethod
+    def __get_open_ports(host, protocol=None):
+        """getting the list of open ports of the host record (optionally only for one protocol)"""
+        return [p['portid'] for p in host.get('ports', list())
+                if p.get('state') == 'open' and (protocol is None or p['protocol'] == protocol)]
 
     def __add__(self, other):
         """the main method gets the object and tries to add it to the database"""
-        self.last_received = other
-        if self.__validate_scan_res():
-            self.__merge_scan_res()
+        self.add(other)
+
+    def add(self, other, trusted=False, scan=None, source=None, fingerprint_time=None):
+        """
+        gets the object and tries to add it to the database, invalid host records are dropped
+        :param other: list of host records
+        :param trusted: the records were produced by gummy itself, only cheap structural checks are done
+        :param scan: information about the scan the records came from (Parser.scan)
+        :param source: where the records came from (for the log), the scan file by default
+        :param fingerprint_time: start of the nmap service scan the records came from, taken from scan by default
+        """
+        if source is None and scan is not None:
+            source = scan.get('file')
+        self.last_received = self.__validate_scan_res(other, trusted=trusted, source=source)
+        if self.last_received is not None:
+            with self.lock:
+                self.__merge_scan_res()
+                if scan is not None:
+                    self.add_scan(scan=scan, count=len(self.last_received))
+                    if fingerprint_time is None:
+                        fingerprint_time = self.get_scan_fingerprint_time(scan)
+                if fingerprint_time is not None:
+                    self.add_fingerprints(self.last_received, fingerprint_time=fingerprint_time)
+
+    @staticmethod
+    def get_scan_fingerprint_time(scan):
+        """start of the scan if it is an nmap service scan (-sV), otherwise None"""
+        if scan.get('scanner') == 'nmap' and scan.get('start') and '-sV' in (scan.get('args') or '').split():
+            return int(scan['start'])
+        return None
+
+    @staticmethod
+    def file_stat(scan):
+        """
+        size and modification time (ns) of the scan file: taken from the scan information if it has them
+        (the state of the file when it was parsed), otherwise the current ones, (None, None) if there is no file
+        """
+        if scan.get('size') is not None and scan.get('mtime') is not None:
+            return scan['size'], scan['mtime']
+        try:
+            stat = os.stat(scan['file'])
+        except OSError:
+            return None, None
+        return stat.st_size, stat.st_mtime_ns
+
+    def add_scan(self, scan, count):
+        """
+        remember that the results of the scan file are in the storage (by the absolute path of the file),
+        with the size and the modification time of the file, a changed file is parsed again (see is_loaded)
+        """
+        name = os.path.abspath(scan['file'])
+        size, mtime = self.file_stat(scan)
+        self.scans[name] = {'num': scan.get('num'),
+                            'file': name,
+                            'scanner': scan.get('scanner'),
+                            'start': scan.get('start'),
+                            'args': scan.get('args'),
+                            'hosts': count,
+                            'size': size,
+                            'mtime': mtime}
+
+    def is_loaded(self, file):
+        """the results of the file are in the storage and the file has not changed since they were added"""
+        scan = self.scans.get(os.path.abspath(file))
+        return scan is not None and scan.get('size') is not None and \
+            (scan['size'], scan['mtime']) == self.file_stat({'file': file})
+
+    def add_fingerprints(self, hosts, fingerprint_time):
+        """
+        remember when the open ports of the hosts were fingerprinted
+        :param fingerprint_time: start of the nmap scan (seconds since the epoch)
+        """
+        for host in hosts:
+            for port in host.get('ports', list()):
+                if port.get('state') == 'open':
+                    key = (host['addr'], port['protocol'], port['portid'])
+                    self.fingerprints[key] = max(self.fingerprints.get(key, 0), fingerprint_time)
+
+    def get_fingerprint_time(self, addr, protocol, portid):
+        """time of the last fingerprint of the socket (seconds since the epoch) or None"""
+        return self.fingerprints.get((addr, protocol, portid))
+
+    def buffer(self, size=500, interval=0.25, trusted=True, source=None, fingerprint_time=None):
+        """
+        bulk ingest API: getting a buffer that adds host records to the storage in batches
+        :param size: flush the buffer when it holds so many records
+        :param interval: flush the buffer when so many seconds have passed since the last flush
+        :param trusted: the records were produced by gummy itself
+        :param source: where the records come from (for the log)
+        :param fingerprint_time: start of the nmap service scan the records come from (the open ports are
+                                 recorded as fingerprinted at that time), None - not a service scan
+        """
+        return StorageBuffer(db=self, size=size, interval=interval, trusted=trusted, source=source,
+                             fingerprint_time=fingerprint_time)
+
+    def add_iter(self, hosts, trusted=True, size=1000, source=None):
+        """
+        add host records from an iterable (for example Parser.iter_hosts) in batches,
+        the records are not collected in memory
+        :param hosts: iterable of host records
+        :param trusted: the records were produced by gummy itself
+        :param size: number of records in one batch
+        :param source: where the records come from (for the log)
+        :return: number of different hosts received
+        """
+        buffer = self.buffer(size=size, interval=float('inf'), trusted=trusted, source=source)
+        addrs = set()
+        for host in hosts:
+            addrs.add(host['addr'])
+            buffer.append(host)
+        buffer.flush()
+        return len(addrs)
+
+    def clear(self):
+        """remove all results: hosts, scans and fingerprints"""
+        with self.lock:
+            self.data = list()
+            self.sockets = dict()
+            self.host_index = dict()
+            self.port_index = dict()
+            self.host_port_index = dict()
+            self.ip_index = IpIndex()
+            self.scans = dict()
+            self.fingerprints = dict()
+
+    def attach(self, workspace_path):
+        """
+        bind the storage to the workspace directory, the snapshot will be written there,
+        the results of the previous workspace are removed
+        """
+        workspace_path = os.path.abspath(workspace_path)
+        if self.workspace_path is not None and workspace_path != self.workspace_path:
+            self.clear()
+        self.workspace_path = workspace_path
+        self.snapshot_path = os.path.join(workspace_path, self.snapshot_name)
+
+    def save_snapshot(self):
+        """
+        write a versioned JSON Lines snapshot of the storage to the workspace directory,
+        the storage is locked only while the results are copied (see snapshot_hosts), not while they are written
+        """
+        if self.snapshot_path is None:
+            return
+        start = time.perf_counter()
+        temp_path = self.snapshot_path + '.tmp'
+        try:
+            with self.snapshot_lock:
+                with self.lock:
+                    workspace_path = self.workspace_path
+                    scans = list(self.scans.values())
+                    hosts = self.snapshot_hosts()
+                    fingerprints = list(self.fingerprints.items())
+                copied = time.perf_counter() - start
+                with open(temp_path, 'w', encoding='utf-8') as snapshot:
+                    snapshot.write(json.dumps({'magic': SNAPSHOT_MAGIC,
+                                               'version': SNAPSHOT_VERSION,
+                                               'workspace': workspace_path}) + '\n')
+                    for scan in scans:
+                        snapshot.write(json.dumps({'scan': scan}) + '\n')
+                    for host in hosts:
+                        snapshot.write(json.dumps({'host': host}) + '\n')
+                    for (addr, protocol, portid), fingerprint_time in fingerprints:
+                        snapshot.write(json.dumps({'fingerprint': [addr, protocol, portid, fingerprint_time]}) + '\n')
+                os.replace(temp_path, self.snapshot_path)
+        except Exception as e:
+            self.log.warning(f'Could not write snapshot {self.snapshot_path}: {e}')
+        else:
+            self.log.debug(f'Snapshot {self.snapshot_path} written in {time.perf_counter() - start:.3f}s '
+                           f'(locked {copied:.3f}s)')
+
+    def snapshot_hosts(self):
+        """
+        host records for the snapshot, called with the lock held,
+        the result is read after the lock is released (a shallow copy of the list of host records)
+        """
+        return list(self.data)
+
+    async def save_snapshot_async(self):
+        """write the snapshot in a worker thread so that the running scans are not blocked"""
+        if self.snapshot_path is None:
+            return
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.save_snapshot)
+
+    def load_snapshot(self):
+        """
+        replace the contents of the storage with the workspace snapshot,
+        the snapshot is used only if it was written for this workspace,
+        the host records are checked as any received records
+        :return: modification time of the snapshot or None if there is no valid snapshot
+        """
+        if self.snapshot_path is None or not os.path.exists(self.snapshot_path):
+            return None
+        self.clear()
+        buffer = self.buffer(size=1000, interval=float('inf'), trusted=False, source=self.snapshot_path)
+        try:
+            with self.lock, open(self.snapshot_path, 'rb') as snapshot:
+                header = json.loads(snapshot.readline() or b'null')
+                if not isinstance(header, dict) or header.get('magic') != SNAPSHOT_MAGIC \
+                        or header.get('version') != SNAPSHOT_VERSION:
+                    self.log.warning(f'Snapshot {self.snapshot_path} has unsupported version, ignored')
+                    return None
+                if header.get('workspace') != self.workspace_path:
+                    self.log.warning(f'Snapshot {self.snapshot_path} was written for {header.get("workspace")}, ignored')
+                    return None
+                for line in snapshot:
+                    item = json.loads(line)
+                    if 'host' in item:
+                        buffer.append(item['host'])
+                    elif 'scan' in item:
+                        self.add_scan(scan=item['scan'], count=int(item['scan']['hosts']))
+                    elif 'fingerprint' in item:
+                        addr, protocol, portid, fingerprint_time = item['fingerprint']
+                        key = (addr, protocol, portid)
+                        self.fingerprints[key] = max(self.fingerprints.get(key, 0), int(fingerprint_time))
+            buffer.flush()
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.log.warning(f'Could not read snapshot {self.snapshot_path}: {e}')
+            # a part of the snapshot must not be taken for the whole workspace
+            self.clear()
+            return None
+        return os.path.getmtime(self.snapshot_path)
+
+    def iter_hosts(self):
+        """iterate over all host records"""
+        return iter(self.data)
+
+    def get_host(self, addr):
+        """getting host record by address or None"""
+        return self.host_index.get(addr)
+
+    def iter_addr_range(self, first, last):
+        """iterate over addresses of the hosts from first to last (integers) inclusive"""
+        return (int_to_ip(ip) for ip in self.ip_index.range(first, last))
+
+    def get_port_hosts(self, portid, protocol=None):
+        """
+        getting the set of hosts on which the port is open
+        :param protocol: tcp, udp or None for both
+        :return: set of addresses or None if the storage has no port index
+        """
+        hosts = set()
+        for proto in ('tcp', 'udp'):
+            if protocol is None or proto == protocol:
+                hosts.update(self.port_index.get((proto, portid), set()))
+        return hosts
+
+    def query(self, networks=None, ports=None, state=None, vendor=None, hostname=None, pattern=None):
+        """
+        search for hosts, all given conditions must match (see gummy.tools.query.parse_query)
+        the address and port indexes are used to select candidates, only they are checked one by one
+        :param networks: list of (first, last) IPv4 ranges as integers, the host must be in any of them
+        :param ports: list of (portid, protocol or None), the host must have any of them in the state
+        :param state: port state, with ports - state of these ports (open by default),
+                      without ports - the host must have any port in this state
+        :param vendor: vendor substring (case insensitive)
+        :param hostname: hostname substring (case insensitive)
+        :param pattern: compiled regular expression for the address
+        :return: list of host records sorted by address
+        """
+        candidates = None
+        if networks is not None:
+            candidates = set()
+            for first, last in networks:
+                candidates.update(self.iter_addr_range(first, last))
+
+        if ports and state is None:
+            state = 'open'
+        if ports and state == 'open':
+            port_hosts = set()
+            for portid, protocol in ports:
+                hosts = self.get_port_hosts(portid, protocol)
+                if hosts is None:
+                    port_hosts = None
+                    break
+                port_hosts.update(hosts)
+            if port_hosts is not None:
+                candidates = port_hosts if candidates is None else candidates & port_hosts
+
+        hosts = self.iter_hosts() if candidates is None else (self.get_host(addr) for addr in candidates)
+        result = [host for host in hosts
+                  if self.__match_host(host, ports=ports, state=state, vendor=vendor, hostname=hostname,
+                                       pattern=pattern)]
+        result.sort(key=lambda host: ip_sort_key(host['addr']))
+        return result
+
+    @staticmethod
+    def __match_host(host, ports, state, vendor, hostname, pattern):
+        """check the host record against the conditions that are not covered by the indexes"""
+        if pattern is not None and not pattern.search(host['addr']):
+            return False
+        if vendor is not None and vendor.lower() not in host.get('vendor', '').lower():
+            return False
+        if hostname is not None and hostname.lower() not in host.get('hostname', '').lower():
+            return False
+        if ports:
+            return any(p['portid'] == portid and (protocol is None or p['protocol'] == protocol)
+                       and p.get('state', '') == state
+                       for p in host.get('ports', list()) for portid, protocol in ports)
+        if state is not None:
+            return any(p.get('state', '') == state for p in host.get('ports', list()))
+        return True
 
     def merge(self, *args):
         """public method that allows the addition of an arbitrary number of objects"""
         merger = Merger(self.m_schema)
-        checker = FormatChecker()
         res = None
         for item in args:
-            try:
-                validate(item, self.v_schema, format_checker=checker)
-                res = merger.merge(res, item)
-            except Exception as e:
-                self.log.warning(e)
+            item = self.__validate_scan_res(item)
+            if item is not None:
+                try:
+                    res = merger.merge(res, item)
+                except Exception as e:
+                    self.log.warning(e)
         return res
 
     @property
     def get_sockets(self, protocol='tcp'):
         """property for getting sockets dict"""
-        tree = objectpath.Tree(self.data)
-        for ip in tree.execute(f"$..addr"):
-            self.sockets[ip] = [p for p in tree.execute(
-                f"$.*[@.addr is '{ip}']..ports[@.protocol is '{protocol}' and @.state is 'open'].portid"
-            )]
+        self.sockets = {ip: self.__get_open_ports(host, protocol) for ip, host in self.host_index.items()}
         return self.sockets
 
     @property
     def get_host_list(self):
         """property for getting hosts list"""
-        tree = objectpath.Tree(self.data)
-        return [i for i in tree.execute(f"$..addr")]
+        return list(self.host_index)
 
     @property
     def get_count_host(self):
         """property for getting number of host"""
-        return len(self.data)
+        return len(self.host_index)
 
     @property
     def get_count_socket(self):
         """property for getting number of sockets"""
-        tree = objectpath.Tree(self.data)
-        return len([p for p in tree.execute(f"$.*..ports[@.state is 'open']")])
-
-    def __get_ports_des(self):
-        """getting the description list for the ports"""
-        data = []
-        try:
-            with open(self.ports_des_file) as csv_file:
-                ports = csv.DictReader(csv_file)
-                for port in ports:
-                    data.append(dict(port))
-
-            self.ports_des = objectpath.Tree(data)
-        except Exception as e:
-            self.log.warning(e)
+        return sum(len(hosts) for hosts in self.port_index.values())
+
+    def export(self, fmt, path, hosts=None):
+        """
+        streaming export of host records to the file, one record is processed at a time
+        csv - one row per port, jsonl - one host record per line, targets - ip:port of the open ports
+        :param fmt: csv, jsonl or targets
+        :param path: output file path
+        :param hosts: iterable of host records (all hosts by default)
+        :return: number of written lines
+        """
+        writers = {'csv': self.__export_csv,
+                   'jsonl': self.__export_jsonl,
+                   'targets': self.__export_targets}
+        if fmt not in writers:
+            self.log.warning(f'Unknown export format {fmt}, use: {", ".join(writers)}')
+            return 0
+        hosts = self.iter_hosts() if hosts is None else hosts
+        with open(path, 'w', newline='') as file:
+            return writers[fmt](hosts, file)
+
+    @staticmethod
+    def __export_csv(hosts, file):
+        """write hosts as csv, one row per port (hosts without ports get one row with empty port fields)"""
+        writer = csv.writer(file)
+        writer.writerow(['addr', 'hostname', 'mac', 'vendor', 'protocol', 'port', 'state'])
+        count = 0
+        for host in hosts:
+            info = [host['addr'], host.get('hostname', ''), host.get('mac', ''), host.get('vendor', '')]
+            ports = host.get('ports') or [dict()]
+            for port in ports:
+                writer.writerow(info + [port.get('protocol', ''), port.get('portid', ''), port.get('state', '')])
+                count += 1
+        return count
+
+    @staticmethod
+    def __export_jsonl(hosts, file):
+        """write host records as json lines"""
+        count = 0
+        for host in hosts:
+            file.write(json.dumps(host) + '\n')
+            count += 1
+        return count
+
+    @staticmethod
+    def __export_targets(hosts, file):
+        """write ip:port lines for all open ports"""
+        count = 0
+        for host in hosts:
+            for port in host.get('ports', list()):
+                if port.get('state') == 'open':
+                    file.write(f'{host["addr"]}:{port["portid"]}\n')
+                    count += 1
+        return count
 
     def get_table(self):
         """this method is designed to display a table of hosts"""
@@ -151,17 +643,13 @@ class Storage:
         table.align = 'l'
         table.align['COUNT'] = 'c'
 
-        tree = objectpath.Tree(self.data)
-        for ip in tree.execute(f"$..addr"):
+        for host in self.iter_hosts():
+            ip = host['addr']
 
-            hostname = tree.execute(f"$.*[@.addr is '{ip}'][0].hostname")
-            if hostname is None:
-                hostname = '-'
+            hostname = host.get('hostname', '-')
             hostname = hostname[:31] + '...' if len(hostname) > 30 else hostname
 
-            vendor = tree.execute(f"$.*[@.addr is '{ip}'][0].vendor")
-            if vendor is None:
-                vendor = '-'
+            vendor = host.get('vendor', '-')
             vendor = vendor[:31] + '...' if len(vendor) > 30 else vendor
 
             table.add_row([
@@ -172,102 +660,38 @@ class Storage:
                 # VENDOR
                 vendor,
                 # COUNT
-                len([p for p in tree.execute(f"$.*[@.addr is '{ip}']..ports[@.state is 'open']")]),
+                len(self.__get_open_ports(host)),
                 # TCP PORTS
-                ', '.join([p for p in tree.execute(
-                    f"$.*[@.addr is '{ip}']..ports[@.protocol is 'tcp' and @.state is 'open'].portid"
-                )]),
+                ', '.join(self.__get_open_ports(host, 'tcp')),
                 # UDP PORTS
-                ', '.join([p for p in tree.execute(
-                    f"$.*[@.addr is '{ip}']..ports[@.protocol is 'udp' and @.state is 'open'].portid"
-                )]),
+                ', '.join(self.__get_open_ports(host, 'udp')),
 
             ])
         return table
 
     def get_ports_info(self):
         """this method is designed to display a table of ports"""
+        # 'port/protocol' -> list of hosts on which the port is open
+        port_dict = dict()
+        for host in self.iter_hosts():
+            for port in host.get('ports', list()):
+                if port.get('state') == 'open':
+                    port_dict.setdefault((port['portid'], port['protocol']), list()).append(host['addr'])
 
-        def gen_port_cat(file):
-            linc = dict()
-            catalog = dict()
-            with open(file) as csv_file:
-                ports = csv.DictReader(csv_file)
-                for port in ports:
-                    port = dict(port)
-                    # gen port linc
-                    if '-' in port['Port']:
-                        range_ports = port['Port'].split('-')
-                        for p in range(int(range_ports[0]), int(range_ports[1])):
-                            linc[p] = port['Port']
-                    else:
-                        linc[port['Port']] = port['Port']
-                    # gen port catalog
-                    if port['Port']:
-                        catalog.setdefault(port['Port'], list()).append(port['Description'])
-
-            return linc, catalog
-
-        def get_port_dict(data):
-            port_dict = dict()
-            for host in data:
-                if 'ports' in host:
-                    for port in host['ports']:
-                        if port['state'] == 'open':
-                            port_dict.setdefault('/'.join([port['portid'], port['protocol']]), dict())
-            return port_dict
-
-        def gen_port_rating_dict(file):
-            port_rating = dict()
-            with open(file) as csv_file:
-                n_serv_csv = csv.DictReader(csv_file)
-                for port in n_serv_csv:
-                    port = dict(port)
-                    port_rating[port['Port']] = port['Rate']
-            return port_rating
-
-        def add_data_to_port_dict(data, port_dict, port_rating):
-            for host in data:
-                if 'ports' in host:
-                    for port in host['ports']:
-                        port_dict['/'.join([port['portid'], port['protocol']])].setdefault('hosts', list()).append(
-                            host['addr'])
-
-            for port_item in port_dict:
-                port_int = port_item.split('/')[0]
-                if port_int in port_linc:
-                    port_dict[port_item]['help'] = port_catalog[port_linc[port_int]]
-
-                if port_item in port_rating:
-                    port_dict[port_item]['rating'] = port_rating[port_item]
-
-            return port_dict
-
-        def get_table(port_dict):
-            table = PrettyTable()
-            table.field_names = ['Port', 'Count', 'Rating', 'Description', 'Hosts']
-            table.sortby = 'Count'
-            table.reversesort = True
-            table.max_width['Description'] = 100
-            table.max_width['Hosts'] = 80
-            table.align = 'l'
-            for port in port_dict:
-                host = port_dict[port]['hosts']
-                rating = port_dict[port]['rating'] if 'rating' in port_dict[port] else '0'
-                desc = port_dict[port]['help'] if 'help' in port_dict[port] else ''
-                table.add_row([
-                    port,
-                    len(host),
-                    rating,
-                    '\n'.join(desc),
-                    ', '.join(host)
-                ])
-
-            return table
-
-        port_linc, port_catalog = gen_port_cat(file=self.ports_des_file)
-        port_rating = gen_port_rating_dict(file=self.ports_rating_file)
-        port_dict = get_port_dict(data=self.data)
-        port_dict = add_data_to_port_dict(data=self.data, port_dict=port_dict, port_rating=port_rating)
-
-        return get_table(port_dict)
+        table = PrettyTable()
+        table.field_names = ['Port', 'Count', 'Rating', 'Description', 'Hosts']
+        table.sortby = 'Count'
+        table.reversesort = True
+        table.max_width['Description'] = 100
+        table.max_width['Hosts'] = 80
+        table.align = 'l'
+        for (portid, protocol), hosts in port_dict.items():
+            table.add_row([
+                '/'.join([portid, protocol]),
+                len(hosts),
+                self.port_catalog.get_rating(portid, protocol),
+                '\n'.join(self.port_catalog.get_description(portid)),
+                ', '.join(hosts)
+            ])
+
+        return table
@@ -20,7 +20,6 @@ setup(
         'prompt_toolkit>2.0',
         'prettytable',
         'colorama',
-        'objectpath',
         'jsonmerge',
         'jsonschema',
         'psutil',
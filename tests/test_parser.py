@@ -0,0 +1,67 @@
+import gc
+import tracemalloc
+
+from gummy.tools import parser as parser_module
+from gummy.tools.parser import Parser
+
+NMAP_HOST = ('<host><status state="up"/><address addr="10.0.{}.{}" addrtype="ipv4"/><ports>'
+             '<port protocol="tcp" portid="22"><state state="open"/></port>'
+             '<port protocol="tcp" portid="445"><state state="open"/></port></ports></host>\n')
+
+
+def write_nmap_xml(path, hosts):
+    """nmap xml file with the number of hosts"""
+    with open(path, 'w') as xml_file:
+        xml_file.write('<?xml version="1.0"?>\n'
+                       f'<nmaprun scanner="nmap" args="nmap -oX {path} -sV" start="1600000000">\n')
+        for i in range(hosts):
+            xml_file.write(NMAP_HOST.format(i >> 8, i & 255))
+        xml_file.write('</nmaprun>\n')
+
+
+def parse_many(parser, file, count):
+    """parse the file count times in a row"""
+    for _ in range(count):
+        parser(file)
+
+
+def test_scan_catalog_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(parser_module, 'CATALOG_SIZE', 20)
+    file = str(tmp_path / '001-n-basic-[10-0-0-0#16]-basic.xml')
+    write_nmap_xml(file, 100)
+    parser = Parser()
+    parser.use_cache = False
+
+    parse_many(parser, file, 50)
+
+    assert parser.scan_count == 50
+    assert len(parser.scan_catalog) == 20
+    assert parser.scan_catalog[-1]['num'] == 49
+    assert parser.scan_catalog[-1]['hosts'] == 100
+    # the catalog holds the scan information and the counts, not the host records
+    assert 'result' not in parser.scan_catalog[-1] and 'ports' not in parser.scan_catalog[-1]
+    assert len(parser.result) == 100
+
+
+def test_parser_memory_does_not_grow(tmp_path, monkeypatch):
+    monkeypatch.setattr(parser_module, 'CATALOG_SIZE', 20)
+    file = str(tmp_path / '001-n-basic-[10-0-0-0#16]-basic.xml')
+    write_nmap_xml(file, 200)
+    parser = Parser()
+    parser.use_cache = False
+
+    tracemalloc.start()
+    try:
+        # the catalog is full after the first parses, later parses only replace its entries
+        parse_many(parser, file, 40)
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        parse_many(parser, file, 100)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    assert len(parser.scan_catalog) == 20
+    # 100 more parses of 200 hosts each (20k host records) must not stay in memory
+    assert after - before < 64 * 1024, (before, after)
@@ -0,0 +1,73 @@
+import copy
+import random
+import tracemalloc
+
+from gummy.tools.compact_storage import CompactStorage
+from gummy.tools.query import parse_query
+from gummy.tools.storage import Storage
+
+QUERIES = ['10.1.0.0/16',
+           '10.2.0.0/16 port 445/tcp',
+           'port 53',
+           '445/tcp state closed',
+           'state closed',
+           'vendor cisco',
+           '10.3.*.1']
+
+
+def make_hosts(count, seed=1):
+    """random host records like the ones received from masscan and nmap"""
+    rnd = random.Random(seed)
+    hosts = list()
+    for _ in range(count):
+        host = {'addr': f'10.{rnd.randint(0, 3)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}',
+                'ports': [{'protocol': rnd.choice(['tcp', 'udp']),
+                           'portid': str(rnd.choice([22, 53, 80, 443, 445, 3389])),
+                           'state': rnd.choice(['open', 'open', 'closed'])}
+                          for _ in range(rnd.randint(1, 4))]}
+        if rnd.random() < 0.1:
+            host['vendor'] = rnd.choice(['Cisco Systems', 'Dell'])
+        hosts.append(host)
+    return hosts
+
+
+def filled(storage_class, hosts):
+    """new storage of the class with the host records and the memory it takes (bytes)"""
+    tracemalloc.start()
+    try:
+        storage = storage_class()
+        # the records are created inside the measurement, the storage may keep them
+        storage.add(copy.deepcopy(hosts), trusted=True)
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return storage, size
+
+
+def sockets(host):
+    """host address with its ports in a comparable form"""
+    return host['addr'], sorted(tuple(sorted(port.items())) for port in host.get('ports', list()))
+
+
+def test_compact_storage_same_results():
+    hosts = make_hosts(3000)
+    storage = Storage()
+    storage.add(hosts, trusted=True)
+    compact = CompactStorage()
+    compact.add(hosts, trusted=True)
+
+    assert compact.get_count_host == storage.get_count_host
+    assert compact.get_count_socket == storage.get_count_socket
+    for query in QUERIES:
+        assert [sockets(h) for h in compact.query(**parse_query(query))] == \
+            [sockets(h) for h in storage.query(**parse_query(query))], query
+
+
+def test_compact_storage_memory():
+    hosts = make_hosts(20000)
+    storage, storage_size = filled(Storage, hosts)
+    compact, compact_size = filled(CompactStorage, hosts)
+
+    assert compact.get_count_socket == storage.get_count_socket
+    # the packed arrays must stay well below the dict records
+    assert compact_size * 2 < storage_size, (compact_size, storage_size)